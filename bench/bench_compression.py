@@ -0,0 +1,114 @@
+# usage  python bench/bench_compression.py --font "DejaVu Sans Mono for Powerline.ttf" --files 300 --levels 1 6 9
+# Compares output size against encode time for each --optimize deflate level, on the individual PDFs
+# and on the merged PDF of a synthetic source tree.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+from synthetic_repo import add_generator_arguments, generator_options, generate_repo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import convert_to_pdf
+
+MERGED_FILENAME = 'app_source.pdf'
+
+def render_individual_pdfs(source_folder, pdf_folder, font_path):
+    """
+    Renders every source file once without --optimize and returns the PDF paths.
+    """
+    for root, dirs, files in os.walk(source_folder):
+        dirs.sort()
+        for file in sorted(files):
+            convert_to_pdf.process_file(os.path.join(root, file), source_folder, pdf_folder, font_path)
+    return sorted(str(path) for path in convert_to_pdf.Path(pdf_folder).rglob('*.pdf'))
+
+def bench_individual(pdf_paths, level):
+    """
+    Rewrites every individual PDF at the given level in memory.
+    Returns (total bytes, seconds spent in optimize_pdf).
+    """
+    total_size = 0
+    seconds = 0.0
+    for pdf_path in pdf_paths:
+        with open(pdf_path, 'rb') as f:
+            data = f.read()
+        if level is None:
+            total_size += len(data)
+            continue
+        start = time.perf_counter()
+        total_size += len(convert_to_pdf.optimize_pdf(data, level))
+        seconds += time.perf_counter() - start
+    return total_size, seconds
+
+def bench_merge(pdf_folder, font_path, level, jobs):
+    """
+    Merges the individual PDFs from scratch at the given level.
+    Returns (merged PDF bytes, seconds).
+    """
+    start = time.perf_counter()
+    convert_to_pdf.merge_pdfs(pdf_folder, MERGED_FILENAME, font_path, jobs=jobs, optimize=level)
+    seconds = time.perf_counter() - start
+    merged_path = os.path.join(pdf_folder, MERGED_FILENAME)
+    size = os.path.getsize(merged_path)
+    # Do not let the next merge pick up this one's output or index
+    os.remove(merged_path)
+    os.remove(convert_to_pdf.Path(merged_path).with_suffix('.index.json'))
+    return size, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF size against encode time for --optimize levels.")
+    parser.add_argument("--font", help="Path to the TTF font file", required=True)
+    parser.add_argument("--levels", type=int, nargs='+', default=[1, 6, 9], help="Deflate levels to compare")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes for the merge")
+    parser.add_argument("--source", help="Benchmark an existing folder instead of generating one")
+    parser.add_argument("--output", help="Write the results JSON to this path")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    convert_to_pdf.import_pypdf2()
+    results = []
+    with tempfile.TemporaryDirectory() as work_folder:
+        source_folder = args.source or os.path.join(work_folder, 'source')
+        if not args.source:
+            generated = generate_repo(source_folder, **generator_options(args))
+            print(f"Generated {generated['text_files']} text and {generated['binary_files']} binary files "
+                  f"({generated['bytes'] / (1024 * 1024):.2f} MB).")
+        pdf_folder = os.path.join(work_folder, 'individual_pdfs')
+        pdf_paths = render_individual_pdfs(source_folder, pdf_folder, args.font)
+        print(f"Rendered {len(pdf_paths)} individual PDFs.")
+
+        for level in [None] + args.levels:
+            individual_size, individual_seconds = bench_individual(pdf_paths, level)
+            merged_size, merge_seconds = bench_merge(pdf_folder, args.font, level, args.jobs)
+            results.append({
+                'level': level,
+                'individual_bytes': individual_size,
+                'individual_encode_seconds': individual_seconds,
+                'merged_bytes': merged_size,
+                'merge_seconds': merge_seconds,
+            })
+        shutil.rmtree(pdf_folder)
+
+    baseline = results[0]
+    print(f"{'level':<6}{'individual MB':>15}{'change':>9}{'encode s':>10}{'merged MB':>11}{'change':>9}{'merge s':>9}")
+    for result in results:
+        individual_change = result['individual_bytes'] / baseline['individual_bytes'] - 1
+        merged_change = result['merged_bytes'] / baseline['merged_bytes'] - 1
+        print(f"{'off' if result['level'] is None else result['level']:<6}"
+              f"{result['individual_bytes'] / (1024 * 1024):>15.2f}{individual_change:>+9.1%}"
+              f"{result['individual_encode_seconds']:>10.2f}"
+              f"{result['merged_bytes'] / (1024 * 1024):>11.2f}{merged_change:>+9.1%}"
+              f"{result['merge_seconds']:>9.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=1)
+        print(f"Results saved to '{args.output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# usage  python bench/bench_font_registry.py --font "DejaVu Sans Mono for Powerline.ttf" --files 200
+# Compares the per-file fixed cost of building a PDF with FPDF.add_font() against FONT_REGISTRY.
+
+import os
+import sys
+import time
+import argparse
+import warnings
+from fpdf import FPDF
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import convert_to_pdf
+
+SAMPLE_TEXT = "def main():\n    return 'héllo wörld'\n"
+
+def render_with_add_font(font_path, font_name):
+    """
+    The pre-registry code path: every PDF re-reads and re-parses the TTF.
+    """
+    pdf = FPDF()
+    pdf.add_page()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        pdf.add_font(font_name, '', font_path, uni=True)
+    pdf.set_font(font_name, size=10)
+    pdf.multi_cell(0, 5, SAMPLE_TEXT)
+    return pdf.output()
+
+def render_with_registry(font_path, font_name):
+    """
+    The current code path: the font is parsed once and shared.
+    """
+    pdf = convert_to_pdf.PDF(font_path, font_name)
+    pdf.multi_cell(0, 5, SAMPLE_TEXT)
+    return pdf.output()
+
+def bench(render, font_path, font_name, files):
+    start = time.perf_counter()
+    for _ in range(files):
+        render(font_path, font_name)
+    return (time.perf_counter() - start) / files
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-file font loading overhead.")
+    parser.add_argument("--font", help="Path to the TTF font file", required=True)
+    parser.add_argument("--fontname", default='CustomFont')
+    parser.add_argument("--files", type=int, default=200, help="Number of simulated files")
+    args = parser.parse_args()
+
+    before = bench(render_with_add_font, args.font, args.fontname, args.files)
+    after = bench(render_with_registry, args.font, args.fontname, args.files)
+    print(f"add_font per file: {before * 1000:.2f} ms")
+    print(f"registry per file: {after * 1000:.2f} ms")
+    print(f"speedup:           {before / after:.2f}x")
+
+if __name__ == "__main__":
+    main()
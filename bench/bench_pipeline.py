@@ -0,0 +1,181 @@
+# usage  python bench/bench_pipeline.py --font "DejaVu Sans Mono for Powerline.ttf" --files 500 --repeat 3 --output results.json
+#        python bench/bench_pipeline.py --font "DejaVu Sans Mono for Powerline.ttf" --files 500 --compare baseline.json
+# Times the full convert_to_pdf.py pipeline and each stage on a synthetic source tree.
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+from synthetic_repo import add_generator_arguments, generator_options, generate_repo
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCRIPT = os.path.join(REPO_ROOT, 'convert_to_pdf.py')
+RESULT_FORMAT = 1  # Bump when the layout of the results JSON changes
+
+# Stage name in the results -> phase name in convert_to_pdf's profile_report.json
+STAGES = {
+    'discovery': 'scan_tree',
+    'process_file': 'process_file',
+    'structure': 'generate_folder_structure_pdf',
+    'merge': 'merge_pdfs',
+}
+
+def run_pipeline(source_folder, output_folder, font_path, jobs, work_folder):
+    """
+    Runs convert_to_pdf.py once from scratch with --profile and returns the measurements.
+    Peak RSS comes from wait4(), so it covers the pipeline process and the workers it waited for.
+    With jobs > 1 the process_file stage is summed over the workers, not wall time.
+    """
+    if os.path.exists(output_folder):
+        shutil.rmtree(output_folder)
+    command = [sys.executable, SCRIPT, source_folder, output_folder, '--font', os.path.abspath(font_path),
+               '--generate-structure', '--merge', '--force', '--profile', '--jobs', str(jobs)]
+    start = time.perf_counter()
+    # Run in the work folder so the pipeline's pdf_conversion.log does not land in the repo
+    # stderr goes to a file rather than a pipe, since nothing reads the pipe until wait4() returns
+    with tempfile.TemporaryFile(dir=work_folder) as stderr:
+        process = subprocess.Popen(command, cwd=work_folder, stdout=subprocess.DEVNULL, stderr=stderr)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_time = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"convert_to_pdf.py failed:\n{stderr.read().decode('utf-8', errors='replace')}")
+
+    with open(os.path.join(output_folder, 'profile_report.json'), 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    totals = report['totals']
+    rendered = [record for record in report['files'] if record['pages']]
+    return {
+        'wall_time': wall_time,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'peak_rss_mb': usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        'files': totals['files'],
+        'files_rendered': len(rendered),
+        'pages': totals['pages'],
+        'bytes_read': totals['bytes_read'],
+        'bytes_written': totals['bytes_written'],
+        'stages': {stage: report['phases'].get(phase, {}).get('seconds', 0.0) for stage, phase in STAGES.items()},
+    }
+
+def summarize(runs):
+    """
+    Takes the median of every measurement over the runs and derives the throughput figures.
+    """
+    wall_time = statistics.median(run['wall_time'] for run in runs)
+    first = runs[0]
+    return {
+        'wall_time': wall_time,
+        'files_per_sec': first['files'] / wall_time,
+        'pages_per_sec': first['pages'] / wall_time,
+        'mb_per_sec': first['bytes_read'] / (1024 * 1024) / wall_time,
+        'peak_rss_mb': statistics.median(run['peak_rss_mb'] for run in runs),
+        'pages': first['pages'],
+        'stages': {stage: statistics.median(run['stages'][stage] for run in runs) for stage in STAGES},
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, current, threshold, min_delta):
+    """
+    Prints the change of each timing against the baseline results.
+    Returns the names of measurements that got slower by more than threshold (a fraction)
+    and by more than min_delta in absolute terms, so sub-millisecond stages do not flap.
+    """
+    if baseline.get('format') != current['format']:
+        print("Baseline was written by a different version of this benchmark; skipping comparison.")
+        return []
+    if baseline['config'] != current['config']:
+        print("Warning: baseline was run with a different configuration.")
+
+    measurements = [('wall_time', baseline['summary']['wall_time'], current['summary']['wall_time'])]
+    measurements += [(f"stage:{stage}", baseline['summary']['stages'].get(stage, 0.0), seconds)
+                     for stage, seconds in current['summary']['stages'].items()]
+    measurements.append(('peak_rss_mb', baseline['summary']['peak_rss_mb'], current['summary']['peak_rss_mb']))
+
+    regressions = []
+    for name, before, after in measurements:
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > threshold and after - before > min_delta:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<22} {before:>10.3f} -> {after:>10.3f} ({change:+.1%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the convert_to_pdf.py pipeline on a synthetic source tree.")
+    parser.add_argument("--font", help="Path to the TTF font file", required=True)
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes passed to convert_to_pdf.py")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs; the median is reported")
+    parser.add_argument("--source", help="Benchmark an existing folder instead of generating one")
+    parser.add_argument("--output", help="Write the results JSON to this path")
+    parser.add_argument("--compare", metavar='BASELINE', help="Compare against a previous results JSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown fraction reported as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="Smallest absolute slowdown (seconds or MB) reported as a regression")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    config = {'jobs': args.jobs, 'source': os.path.abspath(args.source) if args.source else None}
+    if not args.source:
+        config['generator'] = generator_options(args)
+
+    with tempfile.TemporaryDirectory() as work_folder:
+        source_folder = args.source or os.path.join(work_folder, 'source')
+        if not args.source:
+            generated = generate_repo(source_folder, **config['generator'])
+            print(f"Generated {generated['text_files']} text and {generated['binary_files']} binary files "
+                  f"({generated['bytes'] / (1024 * 1024):.2f} MB).")
+
+        runs = []
+        for index in range(args.repeat):
+            run = run_pipeline(source_folder, os.path.join(work_folder, 'output'), args.font, args.jobs, work_folder)
+            runs.append(run)
+            print(f"run {index + 1}: {run['wall_time']:.2f} s, {run['pages']} pages, peak RSS {run['peak_rss_mb']:.1f} MB")
+
+    summary = summarize(runs)
+    results = {
+        'format': RESULT_FORMAT,
+        'config': config,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'revision': git_revision(),
+        },
+        'summary': summary,
+        'runs': runs,
+    }
+
+    print(f"files/sec:  {summary['files_per_sec']:.1f}")
+    print(f"pages/sec:  {summary['pages_per_sec']:.1f}")
+    print(f"MB/sec:     {summary['mb_per_sec']:.2f}")
+    print(f"peak RSS:   {summary['peak_rss_mb']:.1f} MB")
+    for stage, seconds in summary['stages'].items():
+        print(f"{stage + ':':<12}{seconds:.3f} s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+        print(f"Results saved to '{args.output}'.")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold, args.min_delta):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# usage  python bench/bench_subset.py --font "DejaVu Sans Mono for Powerline.ttf" --files 300
+# Compares per-file render time and output size of the individual PDFs under each --subset policy,
+# and with --shared-subset, on a synthetic source tree.
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tempfile
+
+from synthetic_repo import add_generator_arguments, generator_options, generate_repo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import convert_to_pdf
+
+POLICIES = ['always', 'never', 'auto', 'shared']  # 'shared' is --subset always with --shared-subset
+
+def source_files(source_folder):
+    files = []
+    for root, dirs, names in os.walk(source_folder):
+        dirs.sort()
+        files.extend(os.path.join(root, name) for name in sorted(names))
+    return files
+
+def bench_policy(files, source_folder, pdf_folder, font_path, policy):
+    """
+    Renders every file under policy. Returns (per-file seconds of the files that got a PDF,
+    total bytes written, seconds spent building the shared subset).
+    """
+    convert_to_pdf.FONT_REGISTRY.subset_policy = 'always' if policy == 'shared' else policy
+    convert_to_pdf.FONT_REGISTRY.shared_subset = None
+    setup_seconds = 0.0
+    if policy == 'shared':
+        start = time.perf_counter()
+        codepoints = convert_to_pdf.collect_codepoints(files, source_folder)
+        convert_to_pdf.FONT_REGISTRY.shared_subset = convert_to_pdf.SharedSubset(font_path, 'CustomFont', codepoints)
+        setup_seconds = time.perf_counter() - start
+
+    seconds = []
+    total_size = 0
+    for file_path in files:
+        start = time.perf_counter()
+        pages = convert_to_pdf.process_file(file_path, source_folder, pdf_folder, font_path)
+        elapsed = time.perf_counter() - start
+        if pages:
+            seconds.append(elapsed)
+            total_size += convert_to_pdf.individual_pdf_path(file_path, source_folder, pdf_folder).stat().st_size
+    convert_to_pdf.FONT_REGISTRY.shared_subset = None
+    return seconds, total_size, setup_seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark render time and PDF size for each font subsetting policy.")
+    parser.add_argument("--font", help="Path to the TTF font file", required=True)
+    parser.add_argument("--policies", nargs='+', choices=POLICIES, default=POLICIES, help="Policies to compare")
+    parser.add_argument("--source", help="Benchmark an existing folder instead of generating one")
+    parser.add_argument("--output", help="Write the results JSON to this path")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    # Identical files would otherwise be laid out once and replayed for every later policy
+    convert_to_pdf.LAYOUT_CACHE = convert_to_pdf.LayoutCache(0)
+    font_size = len(convert_to_pdf.FONT_REGISTRY.load(args.font)[0])
+    auto_subsets = font_size > convert_to_pdf.SUBSET_AUTO_MIN_SIZE
+    print(f"Font is {font_size / 1024:.0f} KB; --subset auto {'subsets' if auto_subsets else 'embeds'} it.")
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_folder:
+        source_folder = args.source or os.path.join(work_folder, 'source')
+        if not args.source:
+            generated = generate_repo(source_folder, **generator_options(args))
+            print(f"Generated {generated['text_files']} text and {generated['binary_files']} binary files "
+                  f"({generated['bytes'] / (1024 * 1024):.2f} MB).")
+        files = source_files(source_folder)
+
+        for policy in args.policies:
+            pdf_folder = os.path.join(work_folder, f"pdfs_{policy}")
+            seconds, total_size, setup_seconds = bench_policy(files, source_folder, pdf_folder, args.font, policy)
+            results.append({
+                'policy': policy,
+                'pdfs': len(seconds),
+                'mean_ms': statistics.mean(seconds) * 1000,
+                'median_ms': statistics.median(seconds) * 1000,
+                'total_seconds': sum(seconds) + setup_seconds,
+                'setup_seconds': setup_seconds,
+                'total_bytes': total_size,
+            })
+
+    print(f"{'policy':<8}{'PDFs':>6}{'mean ms':>9}{'median ms':>11}{'total s':>9}{'MB':>9}{'KB/PDF':>9}")
+    for result in results:
+        print(f"{result['policy']:<8}{result['pdfs']:>6}{result['mean_ms']:>9.1f}{result['median_ms']:>11.1f}"
+              f"{result['total_seconds']:>9.2f}{result['total_bytes'] / (1024 * 1024):>9.2f}"
+              f"{result['total_bytes'] / 1024 / max(result['pdfs'], 1):>9.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'font_bytes': font_size, 'results': results}, f, indent=1)
+        print(f"Results saved to '{args.output}'.")
+
+if __name__ == "__main__":
+    main()
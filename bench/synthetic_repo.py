@@ -0,0 +1,146 @@
+# usage  python bench/synthetic_repo.py /tmp/synthetic_repo --files 500 --seed 1
+# Generates a reproducible synthetic source tree for benchmarking convert_to_pdf.py.
+
+import os
+import math
+import random
+import shutil
+import argparse
+
+# Non-ASCII characters mixed into text lines; all are covered by DejaVu Sans Mono
+UNICODE_CHARS = "éèüöäßñçøåλπΣΩЖЯжя—–“”‘’…→←✓€£"
+IDENTIFIERS = ['data', 'value', 'result', 'config', 'items', 'index', 'count', 'buffer', 'path', 'name',
+               'handler', 'request', 'response', 'cache', 'token', 'offset', 'record', 'parser', 'node', 'state']
+KEYWORDS = ['def', 'return', 'if', 'for', 'while', 'import', 'class', 'with', 'yield', 'raise']
+TEXT_EXTENSIONS = ['.py', '.js', '.ts', '.md', '.txt', '.json', '.yaml', '.sql', '.html', '.css']
+BINARY_EXTENSIONS = ['.bin', '.png', '.so', '.dat']
+
+DEFAULTS = {
+    'files': 200,
+    'median_size': 4096,
+    'size_sigma': 1.0,
+    'max_size': 512 * 1024,
+    'line_length': 40,
+    'max_line_length': 160,
+    'unicode_ratio': 0.05,
+    'binary_ratio': 0.05,
+    'depth': 3,
+    'fanout': 4,
+    'seed': 1,
+}
+
+def _text_line(rng, line_length, max_line_length, unicode_ratio):
+    """
+    Returns one code-like line whose length follows an exponential distribution around line_length.
+    """
+    length = min(max_line_length, int(rng.expovariate(1 / line_length)) if line_length else 0)
+    indent = ' ' * (4 * rng.randint(0, 3))
+    words = []
+    size = len(indent)
+    while size < length:
+        word = rng.choice(IDENTIFIERS) if rng.random() < 0.8 else rng.choice(KEYWORDS)
+        if rng.random() < unicode_ratio:
+            word += ''.join(rng.choice(UNICODE_CHARS) for _ in range(rng.randint(1, 4)))
+        words.append(word)
+        size += len(word) + 1
+    return (indent + ' '.join(words))[:length].rstrip()
+
+def _text_content(rng, size, line_length, max_line_length, unicode_ratio):
+    lines = []
+    written = 0
+    while written < size:
+        line = _text_line(rng, line_length, max_line_length, unicode_ratio)
+        lines.append(line)
+        written += len(line.encode('utf-8')) + 1
+    return '\n'.join(lines) + '\n'
+
+def _binary_content(rng, size):
+    # A NUL byte in the first block is what SourceFile.is_binary looks for
+    return b'\x00' + rng.randbytes(max(size - 1, 0))
+
+def _directories(rng, depth, fanout):
+    """
+    Returns relative directory paths of a tree with up to `fanout` subfolders per level.
+    """
+    directories = ['']
+    level = ['']
+    for depth_index in range(depth):
+        next_level = []
+        for parent in level:
+            for child_index in range(rng.randint(1, fanout)):
+                next_level.append(os.path.join(parent, f"dir{depth_index}_{child_index}"))
+        directories.extend(next_level)
+        level = next_level
+    return directories
+
+def generate_repo(root, files=DEFAULTS['files'], median_size=DEFAULTS['median_size'],
+                  size_sigma=DEFAULTS['size_sigma'], max_size=DEFAULTS['max_size'],
+                  line_length=DEFAULTS['line_length'], max_line_length=DEFAULTS['max_line_length'],
+                  unicode_ratio=DEFAULTS['unicode_ratio'], binary_ratio=DEFAULTS['binary_ratio'],
+                  depth=DEFAULTS['depth'], fanout=DEFAULTS['fanout'], seed=DEFAULTS['seed']):
+    """
+    Writes a synthetic source tree to root, replacing anything already there.
+    File sizes follow a log-normal distribution around median_size, capped at max_size.
+    The same arguments always produce the same tree.
+
+    Returns a summary dict with the file counts and total bytes written.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    directories = _directories(rng, depth, fanout)
+    for directory in directories:
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    text_files = binary_files = total_bytes = 0
+    for index in range(files):
+        size = min(max_size, max(1, int(rng.lognormvariate(math.log(median_size), size_sigma))))
+        directory = rng.choice(directories)
+        if rng.random() < binary_ratio:
+            data = _binary_content(rng, size)
+            file_name = f"blob{index}{rng.choice(BINARY_EXTENSIONS)}"
+            binary_files += 1
+        else:
+            data = _text_content(rng, size, line_length, max_line_length, unicode_ratio).encode('utf-8')
+            file_name = f"file{index}{rng.choice(TEXT_EXTENSIONS)}"
+            text_files += 1
+        with open(os.path.join(root, directory, file_name), 'wb') as f:
+            f.write(data)
+        total_bytes += len(data)
+
+    return {'text_files': text_files, 'binary_files': binary_files, 'bytes': total_bytes}
+
+def add_generator_arguments(parser):
+    """
+    Adds the generator options to an argparse parser; shared with bench_pipeline.py.
+    """
+    parser.add_argument("--files", type=int, default=DEFAULTS['files'], help="Number of files to generate")
+    parser.add_argument("--median-size", type=int, default=DEFAULTS['median_size'], help="Median file size in bytes")
+    parser.add_argument("--size-sigma", type=float, default=DEFAULTS['size_sigma'], help="Spread of the log-normal size distribution")
+    parser.add_argument("--max-size", type=int, default=DEFAULTS['max_size'], help="Largest file size in bytes")
+    parser.add_argument("--line-length", type=int, default=DEFAULTS['line_length'], help="Mean line length in characters")
+    parser.add_argument("--max-line-length", type=int, default=DEFAULTS['max_line_length'], help="Longest line in characters")
+    parser.add_argument("--unicode-ratio", type=float, default=DEFAULTS['unicode_ratio'], help="Share of words with non-ASCII characters")
+    parser.add_argument("--binary-ratio", type=float, default=DEFAULTS['binary_ratio'], help="Share of binary files")
+    parser.add_argument("--depth", type=int, default=DEFAULTS['depth'], help="Folder nesting depth")
+    parser.add_argument("--fanout", type=int, default=DEFAULTS['fanout'], help="Maximum subfolders per folder")
+    parser.add_argument("--seed", type=int, default=DEFAULTS['seed'], help="Random seed")
+
+def generator_options(args):
+    """
+    Returns the generate_repo keyword arguments from parsed generator options.
+    """
+    return {name: getattr(args, name) for name in DEFAULTS}
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic source tree for benchmarks.")
+    parser.add_argument("root", help="Folder to generate (replaced if it exists)")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    summary = generate_repo(args.root, **generator_options(args))
+    print(f"Generated {summary['text_files']} text and {summary['binary_files']} binary files "
+          f"({summary['bytes'] / (1024 * 1024):.2f} MB) in '{args.root}'.")
+
+if __name__ == "__main__":
+    main()
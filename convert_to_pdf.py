@@ -2,196 +2,3352 @@
 # change the font path to the path of the font you want to use
 
 import os
+import re
+import csv
+import atexit
+import queue
 import sys
+import copy
+import json
+import mmap
+import stat
+import time
+import struct
+import zlib
+import cProfile
+import functools
+import inspect
+import tempfile
+import hashlib
 import argparse
-from fpdf import FPDF
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from collections import Counter, OrderedDict, deque
+from contextlib import nullcontext
+from io import BytesIO
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from tqdm import tqdm
 import logging
+from logging.handlers import QueueHandler, QueueListener
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; DiskLayoutCache.evict() then runs without its lock
+    fcntl = None
+
+# Pip package providing each third-party module, for the missing-dependency message.
+# requirements.txt pins the fpdf2 release whose internals the font code builds on; other
+# releases are checked for them at runtime (see FontClone, IdentitySubsetMap and
+# ListingFontOutputProducer) and get fpdf2's stock font handling where they differ
+REQUIREMENTS = {'fpdf': 'fpdf2', 'fontTools': 'fonttools', 'tqdm': 'tqdm', 'PyPDF2': 'PyPDF2'}
+
+def dependency_message(error):
+    """
+    Returns the install hint for the third-party package an ImportError is about.
+    """
+    module = (error.name or '').split('.')[0]
+    package = REQUIREMENTS.get(module, module or str(error))
+    return f"Required package '{package}' is not installed. Install it with: {sys.executable} -m pip install {package}"
+
+def missing_dependency(error):
+    """
+    Reports a third-party package that is not installed and exits.
+    """
+    message = dependency_message(error)
+    logging.error(message)
+    print(message)
+    sys.exit(1)
+
+def import_pypdf2():
+    """
+    Imports PyPDF2 into the module namespace on first use.
+    Only merging, --optimize and streaming files above MAX_FILE_SIZE need it, so other runs skip
+    the import. Raises ImportError with the install hint if it is missing; main() checks before
+    converting anything, and a worker that still hits it logs the file as failed.
+    """
+    global PdfReader
+    global ArrayObject, DictionaryObject, FloatObject, IndirectObject, NameObject, NullObject, NumberObject, StreamObject
+    if 'PdfReader' in globals():
+        return
+    try:
+        from PyPDF2 import PdfReader
+        from PyPDF2.generic import (
+            ArrayObject, DictionaryObject, FloatObject, IndirectObject, NameObject, NullObject, NumberObject, StreamObject,
+        )
+    except ImportError as e:
+        raise ImportError(dependency_message(e), name=e.name) from e
+
+# Configuration
+# Define discovery filters; --filters FILE adds the rules of a JSON file with the same keys (see PathFilter)
+FILTERS = {
+    'exclude': {
+        'globs': ['.*',  # Hidden files and folders
+                  '__pycache__/', 'node_modules/', 'local_tiktoken_cache/',  # Add folders you want to skip
+                  'README.md', 'generic.pdf', 'with_cabin.pdf','template_EN.pdf','modified_template.pdf','CALIBRI.ttf','CALIBRIB.ttf'],    # Add files you want to skip
+        'extensions': [],  # e.g. '.min.js'
+        'regexes': [],  # Searched in the path relative to the input folder
+    },
+    'include': {'globs': [], 'extensions': [], 'regexes': []},  # When any is set, only matching files are rendered
+    'min_size': None,  # Files below this size in bytes are skipped
+    'max_size': None,  # Files above this size in bytes are skipped
+    'modified_after': None,  # ISO date or datetime; files last modified before it are skipped
+    'modified_before': None,  # ISO date or datetime; files last modified after it are skipped
+}
+DISCOVERY_MODE = 'walk'  # Default for --discovery: 'walk', 'gitignore' or 'git'
+MAX_FILE_SIZE = 2 * 1024 * 1024  # Files above this size in bytes are streamed page by page instead of rendered in memory
+MAX_STREAM_FILE_SIZE = None  # Files above this size in bytes are skipped; None streams files of any size
+STREAM_LINE_LIMIT = 64 * 1024  # Lines longer than this many bytes are laid out in pieces when streaming
+MMAP_SCAN_BLOCK = 1024 * 1024  # Bytes decoded at a time when scanning a mapped file
+MMAP_RELEASE_BYTES = 1024 * 1024  # Mapped pages already laid out are released in steps of this size
+SNIFF_SIZE = 1024  # Bytes checked for null bytes to detect binary files
+MANIFEST_FILENAME = 'pdf_manifest.json'  # Incremental build state, kept in the output folder
+LAYOUT_VERSION = 4  # Bump when rendering changes so incremental builds re-render everything
+MAX_INCREMENTAL_UPDATES = 20  # Rewrite app_source.pdf from scratch after this many appended updates
+MERGE_READ_AHEAD = 4  # Individual PDFs each merge worker may have read ahead of the merged PDF being written
+OBJECT_STREAM_SIZE = 200  # Objects packed into each object stream by --optimize
+WRAP_CACHE_SIZE = 8192  # Wrapped lines of proportional fonts remembered per process
+WRAP_CACHE_MAX_LINE = 160  # Longer lines are wrapped without going through the wrap cache
+SUBSET_POLICY = 'always'  # Default for --subset: 'always', 'never' or 'auto'
+SUBSET_AUTO_MIN_SIZE = 1024 * 1024  # With --subset auto, fonts up to this many bytes are embedded whole
+SHARED_SUBSET_EXTRA = ''.join(map(chr, range(0x20, 0x7F))) + '─│├└'  # Always in the --shared-subset glyph set: ASCII and the structure PDF's tree lines
+LAYOUT_CACHE_BYTES = 64 * 1024 * 1024  # Memory for laid-out listings reused by identical files
+LAYOUT_CACHE_DIR_ENV = 'CONVERT_TO_PDF_CACHE_DIR'  # Default for --cache-dir, e.g. for CI jobs sharing a warm cache
+LAYOUT_CACHE_DISK_MB = 512  # Default size limit of the persistent layout cache
+PROFILE_REPORT_FILENAME = 'profile_report.json'  # Written to the output folder by --profile
+PROFILE_CSV_FILENAME = 'profile_files.csv'  # Per-file timings written alongside the JSON report
+LOG_FILE = 'pdf_conversion.log'  # Default log file, relative to the working directory
+LOG_FORMAT = '%(asctime)s:%(levelname)s:%(message)s'  # Format of the 'text' log format
+# Per-subsystem log levels; fontTools logs several INFO lines for every font it subsets
+LOG_LEVELS = {
+    'fontTools': logging.WARNING,
+    'fpdf': logging.WARNING,
+    'PyPDF2': logging.WARNING,
+}
+
+def parse_arguments(argv=None):
+    """
+    Parses and checks the command line (sys.argv[1:] unless argv is given); main() describes
+    the arguments. --log-levels comes back as a {logger name: level} dict.
+    Only needs the standard library, so it runs before fpdf2 and fontTools are imported.
+    """
+    parser = argparse.ArgumentParser(description="Convert files in a folder to PDFs with file paths, generate folder structure, and merge PDFs.")
+    parser.add_argument("input_folder", help="Path to the input folder (e.g., app_folder)")
+    parser.add_argument("output_folder", help="Path to the output folder where PDFs will be saved")
+    parser.add_argument("--font", help="Path to the TTF font file to use for PDFs", required=True)
+    parser.add_argument("--fontname", help="Name to assign to the custom font in the PDF", default='CustomFont')
+    parser.add_argument("--generate-structure", action='store_true', help="Generate a PDF outlining the folder structure")
+    parser.add_argument("--merge", action='store_true', help="Merge all individual PDFs into a single app_source.pdf")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes for file conversion and merging (0 = all CPUs)")
+    parser.add_argument("--single-pass", action='store_true', help="Render app_source.pdf directly from the sources (implies --merge)")
+    parser.add_argument("--no-individual", action='store_true', help="Do not write individual PDFs (requires --single-pass)")
+    parser.add_argument("--force", action='store_true', help="Re-render every file, ignoring the incremental build manifest")
+    parser.add_argument("--profile", action='store_true', help="Write a per-phase and per-file timing report to the output folder")
+    parser.add_argument("--profile-slowest", type=int, default=0, metavar='N', help="With --profile, write cProfile stats for the N slowest files")
+    parser.add_argument("--log-file", default=LOG_FILE, help="Log file to write")
+    parser.add_argument("--log-level", default='INFO', type=str.upper, help="Level of the application's own log records")
+    parser.add_argument("--log-levels", default='', metavar='NAME=LEVEL,...', help="Per-subsystem log levels, e.g. fontTools=INFO,PyPDF2=ERROR")
+    parser.add_argument("--log-format", choices=['text', 'json'], default='text', help="Log as text lines or JSON lines")
+    parser.add_argument("--cache-dir", default=os.environ.get(LAYOUT_CACHE_DIR_ENV), help=f"Persistent layout cache directory (default: ${LAYOUT_CACHE_DIR_ENV})")
+    parser.add_argument("--cache-size", type=int, default=LAYOUT_CACHE_DISK_MB, metavar='MB', help="Size limit of the persistent layout cache in MB")
+    parser.add_argument("--optimize", type=int, choices=range(10), metavar='LEVEL', help="Deflate streams at LEVEL (0-9) and write object streams (PDF 1.5)")
+    parser.add_argument("--shared-subset", action='store_true', help="Subset the font once for the whole run and embed that subset in every PDF")
+    parser.add_argument("--discovery", choices=['walk', 'gitignore', 'git'], default=DISCOVERY_MODE, help="Scan the folder, scan it honouring .gitignore, or list the files tracked in .git/index")
+    parser.add_argument("--subset", choices=['always', 'never', 'auto'], default=SUBSET_POLICY, help="Subset the font for each PDF, embed it whole, or decide by font size")
+    parser.add_argument("--filters", metavar='FILE', help="JSON file of include/exclude rules added to the default filters")
+    args = parser.parse_args(argv)
+
+    log_levels = {}
+    for item in filter(None, args.log_levels.split(',')):
+        name, _, level = item.partition('=')
+        log_levels[name.strip()] = level.strip().upper()
+    for name, level in [('', args.log_level), *log_levels.items()]:
+        if not isinstance(logging.getLevelName(level), int):
+            parser.error(f"unknown log level '{level}' for {name or 'the application'}")
+    args.log_levels = log_levels
+    return args
+
+if __name__ == "__main__":
+    # Parse the command line before the imports below, so --help and usage errors are instant
+    ARGUMENTS = parse_arguments()
+
+# Needed for every conversion. fontTools and the fpdf2 internals are used by the font registry
+try:
+    from fpdf import FPDF
+    from fpdf.enums import TextEmphasis, FontDescriptorFlags
+    from fpdf.fonts import SubsetMap
+    from fpdf import output as fpdf_output
+    from fpdf.output import OutputProducer
+    from fpdf.syntax import Name, PDFArray, PDFContentStream
+    from fontTools import ttLib
+    from tqdm import tqdm
+except ImportError as e:
+    missing_dependency(e)
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats each log record as one compact JSON object per line.
+    """
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+
+_LOG_LISTENER = None
+_ACTIVE_LOG_LEVELS = {}
+
+def set_log_levels(levels):
+    """
+    Applies a {logger name: level} mapping; the empty name is the root logger.
+    Records below a logger's level are dropped before they are even created.
+    """
+    for name, level in levels.items():
+        logging.getLogger(name or None).setLevel(level)
+    _ACTIVE_LOG_LEVELS.update(levels)
+
+def configure_logging(log_file=LOG_FILE, level=logging.INFO, log_format='text', levels=None):
+    """
+    Sends log records through a queue to a listener thread that formats them and writes
+    log_file, so log I/O stays off the rendering path. log_format is 'text' or 'json'
+    (JSON lines). levels overrides LOG_LEVELS per logger name.
+    """
+    global _LOG_LISTENER
+    stop_logging()
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(JsonLinesFormatter() if log_format == 'json' else logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(QueueHandler(log_queue))
+    set_log_levels({'': level, **LOG_LEVELS, **(levels or {})})
+
+    _LOG_LISTENER = QueueListener(log_queue, file_handler)
+    _LOG_LISTENER.start()
+
+def stop_logging():
+    """
+    Flushes the queued records to the log file and stops the listener thread.
+    """
+    global _LOG_LISTENER
+    if _LOG_LISTENER is not None:
+        _LOG_LISTENER.stop()
+        for handler in _LOG_LISTENER.handlers:
+            handler.close()
+        _LOG_LISTENER = None
+
+atexit.register(stop_logging)
+
+class IdentitySubsetMap(SubsetMap):
+    """
+    SubsetMap that uses the Unicode codepoint itself as the character ID of BMP characters.
+
+    Every document rendered with the same font then encodes a character the same way, which
+    lets merge_pdfs point all pages at one shared font object. Characters outside the BMP get
+    the codepoints of the BMP the font leaves unmapped (see FontRegistry.astral_ids): no other
+    character can pick those, they are fixed per font like the rest, and they stay valid
+    UTF-16 code units for the text encoding of fpdf2 and layout_listing.
+
+    pick() fills in fpdf2's own character ID tables, so it is only used when supported()
+    finds them; documents otherwise keep fpdf2's SubsetMap and its per-document IDs.
+    """
+
+    def __init__(self, font, identities, astral_ids):
+        super().__init__(font, identities)
+        self._astral_ids = astral_ids
+
+    @staticmethod
+    def supported(subset):
+        """
+        Whether subset, a SubsetMap of the installed fpdf2, has the fields pick() relies on.
+        """
+        return (isinstance(getattr(subset, '_char_id_per_glyph', None), dict)
+                and isinstance(getattr(subset, '_char_id_per_unicode', None), dict)
+                and hasattr(subset, 'get_glyph'))
+
+    def pick(self, unicode):
+        char_id = self._char_id_per_unicode.get(unicode)
+        if char_id is not None:
+            return char_id
+        glyph = self.get_glyph(unicode=unicode)
+        if glyph is None:
+            if unicode not in self.font.missing_glyphs:
+                self.font.missing_glyphs.append(unicode)
+            return None
+        char_id = self._char_id_per_glyph.get(glyph)
+        if char_id is None:
+            char_id = unicode if unicode <= 0xFFFF else self._astral_ids.get(unicode)
+            if char_id is None:
+                # More astral characters than unmapped BMP codepoints: left out like a missing glyph
+                if unicode not in self.font.missing_glyphs:
+                    self.font.missing_glyphs.append(unicode)
+                return None
+            self._char_id_per_glyph[glyph] = char_id
+        self._char_id_per_unicode[unicode] = char_id
+        return char_id
+
+class FontRegistry:
+    """
+    Process-wide cache of parsed TrueType fonts.
+
+    Each font file is read and parsed once per (path, mtime) pair. Every PDF
+    instance then gets a cheap per-document copy of the parsed font (see FontClone),
+    sharing the character width table and cmap but owning its own subset map and TTFont
+    handle, since fpdf2 subsets the TTFont in place when the PDF is written.
+    """
+
+    def __init__(self):
+        self._fonts = {}
+        self._fingerprints = {}
+        self.shared_subset = None  # SharedSubset of the run, with --shared-subset
+        self.subset_policy = SUBSET_POLICY  # --subset policy of the run
+        self._font_files = {}
+        self._astral_ids = {}
+
+    def load(self, font_path):
+        """
+        Returns the (font bytes, parsed template, fixed advance, advances) entry for font_path,
+        parsing it on first use. The fixed advance is the common glyph width in 1/1000 em
+        for fixed-pitch fonts, or None for proportional fonts. advances is the glyph width
+        table, an array of widths in 1/1000 em indexed by codepoint up to the highest codepoint
+        the font maps, with the missing-glyph width in the gaps.
+        """
+        key = self.key(font_path)
+        abs_path = key[0]
+        entry = self._fonts.get(key)
+        if entry is None:
+            # Drop entries for older versions of the same file
+            for stale_key in [k for k in self._fonts if k[0] == abs_path]:
+                del self._fonts[stale_key]
+            with open(abs_path, 'rb') as f:
+                data = f.read()
+            parser = FPDF()
+            parser.add_font('template', '', abs_path)
+            template = parser.fonts['template']
+            template.ttfont.close()
+            advance = None
+            if template.desc.flags & FontDescriptorFlags.FIXED_PITCH:
+                advance = Counter(template.cw.values()).most_common(1)[0][0]
+            widths = template.cw
+            missing_width = widths.default_factory()
+            advances = array('H', [missing_width]) * (max(widths) + 1)
+            for codepoint, width in widths.items():
+                advances[codepoint] = width
+            entry = (data, template, advance, advances)
+            self._fonts[key] = entry
+            logging.info(f"Parsed font '{abs_path}' ({len(data)} bytes).")
+            clone = FontClone(template, data)
+            if not clone.supported():
+                logging.warning(f"The installed fpdf2 fonts cannot be copied; parsing '{abs_path}' for every PDF.")
+            if not (clone.supported() and IdentitySubsetMap.supported(template.subset)):
+                logging.warning("The installed fpdf2 subset maps cannot be shared; fonts are subset per PDF "
+                                "and the layout cache is off.")
+        return entry
+
+    def key(self, font_path):
+        """
+        Identifies the current version of a font file: its absolute path and mtime.
+        """
+        abs_path = os.path.abspath(font_path)
+        return abs_path, os.stat(abs_path).st_mtime_ns
+
+    def astral_ids(self, font_path):
+        """
+        Returns the character IDs of the characters outside the BMP that font_path maps, for
+        IdentitySubsetMap: in codepoint order, they take the BMP codepoints the font does not
+        map, from U+FFFF down, leaving out surrogates and ASCII.
+        """
+        key = self.key(font_path)
+        ids = self._astral_ids.get(key)
+        if ids is None:
+            cmap = self.load(font_path)[1].cmap
+            astral = sorted(codepoint for codepoint in cmap if codepoint > 0xFFFF)
+            free = (codepoint for codepoint in range(0xFFFF, 0x7F, -1)
+                    if codepoint not in cmap and not 0xD800 <= codepoint <= 0xDFFF)
+            ids = self._astral_ids[key] = dict(zip(astral, free))
+        return ids
+
+    def fingerprint(self, font_path):
+        """
+        Returns the SHA-256 hex digest of the font file, which identifies it across
+        processes, machines and paths.
+        """
+        key = self.key(font_path)
+        digest = self._fingerprints.get(key)
+        if digest is None:
+            digest = self._fingerprints[key] = hashlib.sha256(self.load(font_path)[0]).hexdigest()
+        return digest
+
+    def attach(self, pdf, font_path, font_name, style=''):
+        """
+        Registers the parsed font on pdf under font_name, like FPDF.add_font() would.
+        Falls back to FPDF.add_font() itself when the installed fpdf2 fonts cannot be cloned
+        (see FontClone).
+        """
+        data, template, _, _ = self.load(font_path)
+        clone = FontClone(template, data)
+        if not clone.supported():
+            pdf.add_font(font_name, style, font_path)
+            return
+        subset_map = SubsetMap
+        if self.identity_ids(font_path):
+            astral_ids = self.astral_ids(font_path)
+            subset_map = lambda font, identities: IdentitySubsetMap(font, identities, astral_ids)
+        clone.attach(pdf, f"{font_name.lower()}{style}", style, subset_map)
+
+    def identity_ids(self, font_path):
+        """
+        Whether documents attached font_path get the fixed character IDs of IdentitySubsetMap,
+        which the layout cache and shared font subsets depend on.
+        """
+        data, template, _, _ = self.load(font_path)
+        return FontClone(template, data).supported() and IdentitySubsetMap.supported(template.subset)
+
+    def subsets(self, font_path, policy=None):
+        """
+        Whether documents embed font_path subset to the characters they use, under policy
+        ('always', 'never' or 'auto'; the run's subset_policy by default). 'auto' subsets
+        fonts larger than SUBSET_AUTO_MIN_SIZE bytes. Font collections are always subset,
+        since a .ttc file cannot be embedded as it is, and so are all fonts when the installed
+        fpdf2 lacks what ListingFontOutputProducer needs to embed them whole.
+        """
+        policy = policy or self.subset_policy
+        data = self.load(font_path)[0]
+        if not ListingFontOutputProducer.supported():
+            return True
+        if policy == 'never':
+            return data[:4] == b'ttcf'
+        if policy == 'auto':
+            return len(data) > SUBSET_AUTO_MIN_SIZE or data[:4] == b'ttcf'
+        return True
+
+    def base_font(self, font_path):
+        """
+        Returns the /BaseFont name documents give font_path: fonts that are subset carry
+        fpdf2's subset tag.
+        """
+        name = self.load(font_path)[1].name
+        return f"/MPDFAA+{name}" if self.subsets(font_path) else f"/{name}"
+
+    def font_file(self, font_path):
+        """
+        Returns the whole font program of font_path deflated, for documents that do not
+        subset it. Compressed once per process.
+        """
+        key = self.key(font_path)
+        font_file = self._font_files.get(key)
+        if font_file is None:
+            self._font_files.clear()
+            font_file = self._font_files[key] = zlib.compress(self.load(font_path)[0])
+        return font_file
+
+    def shared_subset_for(self, font_path):
+        """
+        Returns the run's SharedSubset if it was built from font_path, otherwise None.
+        """
+        shared = self.shared_subset
+        if shared is not None and shared.font_id == self.fingerprint(font_path):
+            return shared
+        return None
+
+FONT_REGISTRY = FontRegistry()
+
+class FontClone:
+    """
+    Adapter that registers a copy of a font fpdf2 parsed once on other documents, for
+    FontRegistry.attach. This is the only code that patches the fields of fpdf2's TTFFont.
+
+    The copy shares the template's glyph widths and cmap, and gets its own descriptor,
+    missing glyph list, lazy fontTools handle and subset map, since fpdf2 subsets the
+    handle in place when a document is written.
+    """
+
+    # TTFFont fields the copy reads or replaces
+    FIELDS = ('i', 'name', 'desc', 'cw', 'fontkey', 'emphasis', 'subset', 'cmap', 'ttfont', 'missing_glyphs')
+
+    def __init__(self, template, data):
+        self.template = template
+        self.data = data
+
+    def supported(self):
+        """
+        Whether the installed fpdf2 gives fonts the fields this adapter patches.
+        """
+        return all(hasattr(self.template, name) for name in self.FIELDS)
+
+    def attach(self, pdf, fontkey, style, subset_map):
+        """
+        Registers a copy of the template on pdf under fontkey. subset_map(font, identities)
+        makes the subset map of the copy.
+        """
+        font = copy.copy(self.template)
+        font.i = len(pdf.fonts) + 1
+        font.fontkey = fontkey
+        font.emphasis = TextEmphasis.coerce(style)
+        font.desc = copy.copy(self.template.desc)
+        font.missing_glyphs = []
+        font.ttfont = ttLib.TTFont(BytesIO(self.data), recalcTimestamp=False, fontNumber=0, lazy=True)
+
+        # Same reserved identities as TTFFont.__init__
+        reserved = "\x00 \r\n"
+        if pdf.str_alias_nb_pages:
+            reserved += "0123456789" + pdf.str_alias_nb_pages
+        font.subset = subset_map(font, [ord(char) for char in reserved])
+
+        pdf.fonts[fontkey] = font
+
+class SharedSubset:
+    """
+    One subset of the listing font covering every character of a run (--shared-subset).
+
+    It is built once by fpdf2's own font embedding code, and its font program, widths,
+    ToUnicode CMap and CIDToGIDMap are then embedded as they are in every document whose
+    characters it covers, so those documents skip fontTools subsetting. Since character
+    IDs are codepoints (see IdentitySubsetMap), the same subset fits every document.
+    Instances only hold bytes and strings, so they can be sent to worker processes.
+    """
+
+    def __init__(self, font_path, font_name, codepoints):
+        pdf = PDF(font_path, font_name)
+        font = pdf.current_font
+        for codepoint in sorted(codepoints):
+            font.subset.pick(codepoint)
+        self.font_id = pdf.font_id
+        self.codepoints = frozenset(font.subset._char_id_per_unicode)
+        self.char_ids = frozenset(font.subset._char_id_per_glyph.values())
+
+        composite_font = OutputProducer(pdf)._add_fonts()[font.i]
+        cid_font = composite_font.descendant_fonts[0]
+        self.widths = cid_font.w
+        self.to_unicode = composite_font.to_unicode.content_stream()
+        self.cid_to_gid_map = cid_font.c_i_d_to_g_i_d_map.content_stream()
+        font_file = cid_font.font_descriptor.font_file2
+        self.font_file = font_file.content_stream()
+        self.font_file_length = font_file.length1
+        logging.info(f"Built shared font subset with {len(self.codepoints)} characters "
+                     f"({len(self.font_file)} bytes compressed).")
+
+    def covers(self, font):
+        """
+        Whether every character ID the document uses with font is in this subset,
+        reserved ones included.
+        """
+        return self.char_ids.issuperset(font.subset._char_id_per_glyph.values())
+
+    def add_objects(self, producer, font):
+        """
+        Adds the font objects for font to producer and returns the Type0 font object.
+        """
+        return _add_font_objects(producer, font, f"MPDFAA+{font.name}", self.widths, self.to_unicode,
+                                 self.cid_to_gid_map, self.font_file, self.font_file_length)
+
+def _add_font_objects(producer, font, fontname, widths, to_unicode, cid_to_gid_map, font_file, font_file_length):
+    """
+    Adds the objects of a Type0 font to producer, in the same layout as OutputProducer._add_fonts,
+    and returns the Type0 font object. cid_to_gid_map and font_file are deflated already.
+    """
+    if font.missing_glyphs:
+        logging.getLogger('fpdf.output').warning(
+            "Font %s is missing the following glyphs: %s", fontname, ", ".join(chr(x) for x in font.missing_glyphs))
+
+    composite_font_obj = fpdf_output.PDFFont(subtype="Type0", base_font=fontname, encoding="Identity-H")
+    producer._add_pdf_obj(composite_font_obj, "fonts")
+    cid_font_obj = fpdf_output.PDFFont(subtype="CIDFontType2", base_font=fontname, d_w=font.desc.missing_width, w=widths)
+    producer._add_pdf_obj(cid_font_obj, "fonts")
+    composite_font_obj.descendant_fonts = PDFArray([cid_font_obj])
+
+    to_unicode_obj = PDFContentStream(to_unicode)
+    producer._add_pdf_obj(to_unicode_obj, "fonts")
+    composite_font_obj.to_unicode = to_unicode_obj
+
+    cid_system_info_obj = fpdf_output.CIDSystemInfo()
+    producer._add_pdf_obj(cid_system_info_obj, "fonts")
+    cid_font_obj.c_i_d_system_info = cid_system_info_obj
+
+    font_descriptor_obj = font.desc
+    font_descriptor_obj.font_name = Name(fontname)
+    producer._add_pdf_obj(font_descriptor_obj, "fonts")
+    cid_font_obj.font_descriptor = font_descriptor_obj
+
+    cid_to_gid_map_obj = _deflated_content_stream(cid_to_gid_map)
+    producer._add_pdf_obj(cid_to_gid_map_obj, "fonts")
+    cid_font_obj.c_i_d_to_g_i_d_map = cid_to_gid_map_obj
+
+    font_file_obj = _deflated_content_stream(font_file)
+    font_file_obj.length1 = font_file_length
+    producer._add_pdf_obj(font_file_obj, "fonts")
+    font_descriptor_obj.font_file2 = font_file_obj
+
+    font.close()
+    return composite_font_obj
+
+def _to_unicode_cmap(font):
+    """
+    Returns the ToUnicode CMap fpdf2 writes for the characters picked from font.
+    """
+    def format_code(unicode):
+        if unicode > 0xFFFF:
+            # Surrogate pair
+            return f"{0xD800 | (unicode - 0x10000) >> 10:04X}{0xDC00 | (unicode & 0x3FF):04X}"
+        return f"{unicode:04X}"
+
+    bf_chars = [f'<{char_id:04X}> <{"".join(format_code(code) for code in glyph.unicode)}>\n'
+                for glyph, char_id in font.subset.items() if glyph.unicode]
+    return ("/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+            "/CIDSystemInfo\n<</Registry (Adobe)\n/Ordering (UCS)\n/Supplement 0\n>> def\n"
+            "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+            "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+            f"{len(bf_chars)} beginbfchar\n{''.join(bf_chars)}endbfchar\n"
+            "endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend")
+
+def _full_cid_to_gid_map(font):
+    """
+    Returns the deflated CIDToGIDMap from the character IDs picked from font to the
+    glyph IDs of the whole font.
+    """
+    data = bytearray(256 * 256 * 2)
+    for glyph, char_id in font.subset.items():
+        # fpdf2 gives .notdef a codepoint instead of a glyph ID; it is glyph 0
+        glyph_id = 0 if glyph.glyph_name == '.notdef' else glyph.glyph_id
+        data[char_id * 2:char_id * 2 + 2] = glyph_id.to_bytes(2, 'big')
+    return zlib.compress(data)
+
+def _deflated_content_stream(data):
+    """
+    Wraps already deflated data in an fpdf2 content stream without compressing it again.
+    """
+    stream = PDFContentStream(data)
+    stream.filter = Name("FlateDecode")
+    return stream
+
+class ListingFontOutputProducer(OutputProducer):
+    """
+    OutputProducer that embeds the listing font per the PDF's subset policy: from the run's
+    SharedSubset when that covers the document, or whole when the font is not to be subset.
+    Otherwise fpdf2 subsets the font for the document as usual, and it embeds every other
+    font of the document in any case.
+
+    It overrides fpdf2 internals, so it is only used when supported() finds them; the font
+    is then always subset by fpdf2 (see FontRegistry.subsets).
+    """
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def supported():
+        """
+        Whether the installed fpdf2 has the output internals this producer and
+        _add_font_objects build on.
+        """
+        return ('output_producer_class' in inspect.signature(FPDF.output).parameters
+                and list(inspect.signature(OutputProducer._add_fonts).parameters) == ['self']
+                and hasattr(OutputProducer, '_add_pdf_obj')
+                and all(hasattr(fpdf_output, name) for name in ('PDFFont', 'CIDSystemInfo', '_tt_font_widths')))
+
+    def _add_fonts(self):
+        pdf = self.fpdf
+        fonts = pdf.fonts
+        font = fonts.get(pdf.listing_fontkey)
+        if font is None or not self.supported():
+            return super()._add_fonts()
+        if not pdf.subset_font:
+            def add_objects():
+                return _add_font_objects(self, font, font.name, fpdf_output._tt_font_widths(font), _to_unicode_cmap(font),
+                                         _full_cid_to_gid_map(font), FONT_REGISTRY.font_file(pdf.font_path),
+                                         len(FONT_REGISTRY.load(pdf.font_path)[0]))
+        elif pdf.shared_subset.covers(font):
+            def add_objects():
+                return pdf.shared_subset.add_objects(self, font)
+        else:
+            logging.info("Characters outside the shared font subset; subsetting the font for this document.")
+            return super()._add_fonts()
+        # fpdf2 embeds the remaining fonts, if any
+        del fonts[font.fontkey]
+        try:
+            font_objs_per_index = super()._add_fonts()
+        finally:
+            fonts[font.fontkey] = font
+        font_objs_per_index[font.i] = add_objects()
+        return font_objs_per_index
+
+class LayoutCache:
+    """
+    Process-wide LRU cache of laid-out listings, so byte-identical files are laid out once.
+
+    Keys combine the content digest with everything the layout depends on (font, page
+    geometry and the starting position), and entries hold the page text objects together
+    with the codepoints they use. Entries are evicted least recently used first once their
+    total size passes max_bytes. With a DiskLayoutCache set as disk, misses are looked up
+    there and new entries are stored there too, so they outlive the process.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk = None
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        if self.disk is not None:
+            self.disk.put(key, entry)
+        self._remember(key, entry)
+
+    def _remember(self, key, entry):
+        entry_size = entry.size()
+        if entry_size > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = entry
+        self.size += entry_size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size()
+
+class LayoutEntry:
+    """
+    A laid-out listing: the (text object, page_full) pairs of layout_listing, the codepoints
+    the font subset needs for them, and the y position where the listing ends.
+    """
+    __slots__ = ('pages', 'codepoints', 'end_y')
+
+    def __init__(self, pages, codepoints, end_y):
+        self.pages = pages
+        self.codepoints = codepoints
+        self.end_y = end_y
+
+    def size(self):
+        return sum(len(text_object) for text_object, _ in self.pages) + 8 * len(self.codepoints)
+
+    def to_bytes(self):
+        """
+        Serializes the entry: a JSON header line followed by the compressed text objects.
+        """
+        header = {
+            'codepoints': self.codepoints,
+            'end_y': self.end_y,
+            'pages': [[len(text_object), page_full] for text_object, page_full in self.pages],
+        }
+        return (json.dumps(header, separators=(',', ':')).encode('ascii') + b'\n'
+                + zlib.compress(b''.join(text_object for text_object, _ in self.pages)))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Parses the output of to_bytes(). Raises ValueError (or zlib.error) on damaged data.
+        """
+        header_end = data.index(b'\n')
+        header = json.loads(data[:header_end])
+        body = zlib.decompress(data[header_end + 1:])
+        pages = []
+        offset = 0
+        for length, page_full in header['pages']:
+            pages.append((body[offset:offset + length], page_full))
+            offset += length
+        if offset != len(body):
+            raise ValueError("layout cache entry does not match its header")
+        return cls(pages, header['codepoints'], header['end_y'])
+
+class DiskLayoutCache:
+    """
+    Persistent layout cache, shared by runs, output folders and concurrent processes.
+
+    Each entry is a file named after a hash of its LayoutCache key plus LAYOUT_VERSION.
+    Entries are written to a temporary file and renamed into place, so readers never see a
+    partial entry, and two processes storing the same key just replace one identical file
+    with another. Hits refresh an entry's mtime; evict() deletes the least recently used
+    entries once the directory holds more than max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        name = hashlib.sha256(repr((LAYOUT_VERSION, key)).encode('utf-8')).hexdigest()
+        return self.directory / name[:2] / f"{name}.layout"
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = LayoutEntry.from_bytes(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, zlib.error) as e:
+            logging.warning(f"Discarding unreadable layout cache entry '{path}': {e}")
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # Evicted by another process in the meantime
+            pass
+        return entry
+
+    def put(self, key, entry):
+        path = self._path(key)
+        temp_path = None
+        try:
+            path.parent.mkdir(exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(entry.to_bytes())
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not store layout cache entry '{path}': {e}")
+            if temp_path is not None:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache holds at most max_bytes, along
+        with temporary files abandoned by killed writers. Skipped while another process is
+        evicting. Returns the number of entries deleted.
+        """
+        with open(self.directory / '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return 0
+            entries = []
+            total = 0
+            stale = time.time() - 3600
+            for bucket in os.scandir(self.directory):
+                if not bucket.is_dir():
+                    continue
+                for item in os.scandir(bucket.path):
+                    try:
+                        st = item.stat()
+                        if item.name.startswith('.tmp-'):
+                            if st.st_mtime < stale:
+                                os.unlink(item.path)
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, item.path))
+                    total += st.st_size
+
+            removed = 0
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+        if removed:
+            logging.info(f"Evicted {removed} layout cache entries from '{self.directory}'.")
+        return removed
+
+LAYOUT_CACHE = LayoutCache(LAYOUT_CACHE_BYTES)
+
+class _PhaseTimer:
+    """
+    Context manager that adds its wall time to one phase of a Profiler.
+    """
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add_phase(self.name, time.perf_counter() - self.start)
+        return False
+
+_NO_PHASE = nullcontext()
+
+class Profiler:
+    """
+    Collects per-phase wall times and per-file statistics for --profile.
+    Disabled by default, in which case timing a phase costs one attribute check.
+    Phases nest, so each phase's time includes the phases it calls.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.phases = {}  # phase name -> [calls, seconds]
+        self.files = []
+
+    def phase(self, name):
+        return _PhaseTimer(self, name) if self.enabled else _NO_PHASE
+
+    def add_phase(self, name, seconds, calls=1):
+        totals = self.phases.setdefault(name, [0, 0.0])
+        totals[0] += calls
+        totals[1] += seconds
+
+    def record_file(self, file_path, seconds, bytes_read, bytes_written, pages):
+        self.files.append({
+            'path': str(file_path),
+            'seconds': seconds,
+            'bytes_read': bytes_read,
+            'bytes_written': bytes_written,
+            'pages': pages,
+        })
+
+    def drain(self):
+        """
+        Returns and clears what was collected so far, so a worker can hand it to the parent.
+        """
+        collected = (self.phases, self.files)
+        self.phases, self.files = {}, []
+        return collected
+
+    def merge(self, collected):
+        phases, files = collected
+        for name, (calls, seconds) in phases.items():
+            self.add_phase(name, seconds, calls)
+        self.files.extend(files)
+
+    def slowest_files(self, count):
+        return sorted(self.files, key=lambda record: record['seconds'], reverse=True)[:count]
+
+    def write_report(self, output_folder, wall_time):
+        """
+        Writes profile_report.json (phases, totals and per-file timings)
+        and profile_files.csv (per-file timings) to output_folder.
+        Returns the path of the JSON report.
+        """
+        files = sorted(self.files, key=lambda record: record['path'])
+        report = {
+            'wall_time': wall_time,
+            'phases': {name: {'calls': calls, 'seconds': seconds}
+                       for name, (calls, seconds) in sorted(self.phases.items())},
+            'totals': {
+                'files': len(files),
+                'bytes_read': sum(record['bytes_read'] for record in files),
+                'bytes_written': sum(record['bytes_written'] for record in files),
+                'pages': sum(record['pages'] for record in files),
+            },
+            'files': files,
+        }
+        report_path = Path(output_folder) / PROFILE_REPORT_FILENAME
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+        with open(report_path.with_name(PROFILE_CSV_FILENAME), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['path', 'seconds', 'bytes_read', 'bytes_written', 'pages'])
+            writer.writeheader()
+            writer.writerows(files)
+        return report_path
+
+PROFILER = Profiler()
+
+class SizeReport:
+    """
+    Totals of PDF sizes without and with --optimize, per kind of output.
+    Like the profiler, workers hand their totals to the parent (see drain and merge).
+    """
+    def __init__(self):
+        self.totals = {}  # kind -> [PDFs, bytes without --optimize, bytes with it]
+
+    def add(self, kind, plain_size, optimized_size, count=1):
+        totals = self.totals.setdefault(kind, [0, 0, 0])
+        totals[0] += count
+        totals[1] += plain_size
+        totals[2] += optimized_size
+
+    def drain(self):
+        collected, self.totals = self.totals, {}
+        return collected
+
+    def merge(self, collected):
+        for kind, (count, plain_size, optimized_size) in collected.items():
+            self.add(kind, plain_size, optimized_size, count)
+
+    def report(self):
+        """
+        Logs and prints the size reduction of each kind of output.
+        """
+        for kind, (count, plain_size, optimized_size) in self.totals.items():
+            change = (optimized_size - plain_size) / plain_size if plain_size else 0.0
+            message = (f"Optimized {count} {kind}: {plain_size / (1024 * 1024):.2f} MB -> "
+                       f"{optimized_size / (1024 * 1024):.2f} MB ({change:+.1%})")
+            logging.info(message)
+            print(message)
+
+SIZE_REPORT = SizeReport()
+
+def profiled(name):
+    """
+    Decorator that times every call of the decorated function as phase `name` while profiling.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            with _PhaseTimer(PROFILER, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _wrap_columns(line, columns):
+    """
+    Wraps a line to at most columns characters per row, breaking at the last space
+    that fits (the space is dropped, as multi_cell does) or mid-word when there is none.
+    """
+    rows = []
+    while len(line) > columns:
+        cut = line.rfind(' ', 0, columns + 1)
+        if cut <= 0:
+            rows.append(line[:columns])
+            line = line[columns:]
+        else:
+            rows.append(line[:cut])
+            line = line[cut + 1:]
+            if not line:
+                return rows
+    rows.append(line)
+    return rows
+
+def _wrap_widths(line, advances, missing_width, limit):
+    """
+    Wraps a line of a proportional font to rows at most limit wide, with the same break
+    rules as _wrap_columns. advances and limit are in 1/1000 em (see FontRegistry.load).
+    The cumulative widths of the line are summed once; each break is then a bisection.
+    """
+    try:
+        ends = list(accumulate(map(advances.__getitem__, map(ord, line))))
+    except IndexError:
+        # Beyond the highest codepoint the font maps
+        size = len(advances)
+        ends = list(accumulate(advances[codepoint] if codepoint < size else missing_width
+                               for codepoint in map(ord, line)))
+    rows = []
+    start = 0
+    base = 0
+    while ends and ends[-1] - base > limit:
+        # First character that does not fit
+        over = bisect_right(ends, base + limit, start)
+        if line[over] == ' ':
+            cut = over
+        else:
+            cut = line.rfind(' ', start, over)
+        if cut <= start:
+            # Mid-word, keeping at least one character per row
+            cut = max(over, start + 1)
+            rows.append(line[start:cut])
+            start = cut
+        else:
+            rows.append(line[start:cut])
+            start = cut + 1
+            if start == len(line):
+                return rows
+        base = ends[start - 1]
+    rows.append(line[start:])
+    return rows
+
+class WrapCache:
+    """
+    Process-wide LRU cache of wrapped lines for proportional fonts.
+
+    Blank lines, braces and common imports repeat throughout a source tree, so their rows
+    are kept under the font, the line width and the line itself. Lines longer than
+    WRAP_CACHE_MAX_LINE characters rarely repeat and are wrapped directly.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def wrapper(self, font_id, advances, missing_width, limit):
+        """
+        Returns a function wrapping one line to rows, as _wrap_widths(line, advances, missing_width, limit).
+        """
+        entries = self._entries
+
+        def wrap(line):
+            if len(line) > WRAP_CACHE_MAX_LINE:
+                return _wrap_widths(line, advances, missing_width, limit)
+            key = (font_id, limit, line)
+            rows = entries.get(key)
+            if rows is not None:
+                entries.move_to_end(key)
+                self.hits += 1
+                return rows
+            self.misses += 1
+            rows = entries[key] = _wrap_widths(line, advances, missing_width, limit)
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            return rows
+        return wrap
+
+WRAP_CACHE = WrapCache(WRAP_CACHE_SIZE)
+
+class _SubsetCodeMap(dict):
+    """
+    str.translate() table from codepoints to font subset character codes.
+    Glyphs are picked on first use; characters without a glyph are dropped.
+    """
+    def __init__(self, subset):
+        super().__init__()
+        self.subset = subset
+
+    def __missing__(self, codepoint):
+        char_id = self.subset.pick(codepoint)
+        value = self[codepoint] = chr(char_id) if char_id else None
+        return value
+
+def _listing_text_object(page_ops):
+    """
+    Joins the text operations collected for one page into a single text object.
+    """
+    if not page_ops:
+        return b''
+    return b'BT\n' + b'\n'.join(page_ops) + b'\nET'
+
+def _escape_pdf_string(data):
+    """
+    Escapes the bytes of a PDF literal string.
+    """
+    return data.replace(b'\\', b'\\\\').replace(b')', b'\\)').replace(b'(', b'\\(').replace(b'\r', b'\\r')
+
+class PDF(FPDF):
+    def __init__(self, font_path, font_name='CustomFont', creation_date=None, subset=None):
+        super().__init__()
+        # A fixed creation date makes the output (including the /ID) reproducible
+        if creation_date is not None:
+            self.set_creation_date(creation_date)
+        self.set_auto_page_break(auto=True, margin=15)
+        self.add_page()
+
+        # Add TrueType font with Unicode support
+        if not os.path.isfile(font_path):
+            logging.error(f"Font file '{font_path}' not found.")
+            print(f"Font file '{font_path}' not found. Please ensure the font path is correct.")
+            sys.exit(1)
+
+        FONT_REGISTRY.attach(self, font_path, font_name)
+        self.set_font(font_name, size=10)
+        self.files_rendered = 0
+        self.listing_fontkey = self.current_font.fontkey
+        self.identity_ids = FONT_REGISTRY.identity_ids(font_path)
+        _, _, self.fixed_advance, self.advances = FONT_REGISTRY.load(font_path)
+        self.font_id = FONT_REGISTRY.fingerprint(font_path)
+        # subset is the --subset policy for this document, the run's policy by default
+        self.font_path = font_path
+        self.subset_font = FONT_REGISTRY.subsets(font_path, subset)
+        self.shared_subset = FONT_REGISTRY.shared_subset_for(font_path) if self.subset_font else None
+
+    def start_file(self):
+        """
+        Starts a new source file on a fresh page, unless nothing has been rendered yet.
+        """
+        if self.files_rendered:
+            self.add_page()
+        self.files_rendered += 1
+
+    def add_text(self, text):
+        """
+        Adds multi-line text to the PDF.
+        The listing font uses the bulk code-listing layout; other fonts fall back to multi_cell.
+        """
+        with PROFILER.phase('add_text'):
+            if self.add_listing(text):
+                return
+            # Split text into lines to handle wrapping
+            for line in text.split('\n'):
+                self.multi_cell(0, 5, line)
+                self.ln()
+
+    def output(self, *args, **kwargs):
+        """
+        Serialises the document (font subsetting included), timed as the 'output' phase.
+        With a shared subset, or when the font is not to be subset, the font is embedded by
+        ListingFontOutputProducer instead of being subset for this document.
+        """
+        if (self.shared_subset is not None or not self.subset_font) and ListingFontOutputProducer.supported():
+            kwargs.setdefault('output_producer_class', ListingFontOutputProducer)
+        with PROFILER.phase('output'):
+            return super().output(*args, **kwargs)
+
+    def add_listing(self, text, line_height=5):
+        """
+        Lays out text as a code listing with the same geometry as add_text's multi_cell path,
+        but computes wrap points from character counts (or glyph widths for proportional fonts)
+        and page breaks up front, then writes each page's text to the content stream in one go.
+        Tabs are expanded to 4 columns. Returns False without rendering if listing_fits() says
+        the text needs multi_cell.
+        """
+        text = text.expandtabs(4)
+        chars = set(text)
+        chars.discard('\n')
+        if not self.listing_fits(chars):
+            return False
+        self.write_listing(((line, True) for line in text.split('\n')), line_height)
+        return True
+
+    def add_source(self, source, line_height=5):
+        """
+        Adds the content of a SourceFile, like add_text(source.read_text()) would.
+        Listings are laid out straight from the file's memory map one line at a time, so the
+        content is never held as one str; text that needs multi_cell goes through add_text.
+
+        Listings are kept in LAYOUT_CACHE, so a byte-identical file starting at the same
+        position replays the cached pages instead of being laid out again. The cache is only
+        used when the font has IdentitySubsetMap character IDs.
+        """
+        if self.current_font.fontkey != self.listing_fontkey:
+            self.add_text(source.read_text())
+            return
+        # Cached pages hold character IDs, which only carry over to other documents with IdentitySubsetMap
+        key = (source.digest(), self.listing_state(line_height)) if self.identity_ids else None
+        entry = LAYOUT_CACHE.get(key) if key else None
+        if entry is None:
+            chars = source.characters()
+            if not self.listing_fits(chars):
+                self.add_text(source.read_text())
+                return
+            with PROFILER.phase('add_text'):
+                pages = []
+                code_map = _SubsetCodeMap(self.current_font.subset)
+                pieces = ((line.expandtabs(4), ends_line) for line, ends_line in source.lines())
+                for page in self.layout_listing(pieces, line_height, code_map):
+                    pages.append(page)
+                    self.emit_listing_page(*page)
+            # In order of first use, so replaying the picks gives the same subset
+            if key:
+                LAYOUT_CACHE.put(key, LayoutEntry(pages, list(code_map), self.y))
+            return
+
+        with PROFILER.phase('add_text'):
+            subset = self.current_font.subset
+            for codepoint in entry.codepoints:
+                subset.pick(codepoint)
+            for page in entry.pages:
+                self.emit_listing_page(*page)
+            self.x = self.l_margin
+            self.y = entry.end_y
+            self.lasth = line_height
+
+    def listing_state(self, line_height=5):
+        """
+        Everything besides the text that determines the output of layout_listing.
+        """
+        return (self.font_id, self.font_size, self.fixed_advance, line_height, self.w, self.h,
+                self.l_margin, self.r_margin, self.t_margin, self.c_margin, self.page_break_trigger,
+                self.x, self.y)
+
+    def listing_fits(self, chars):
+        """
+        Whether text made of chars can use the listing layout: the current font must be the
+        listing font. With a fixed-pitch font every character must have its fixed advance;
+        with a proportional font the text must not contain the soft hyphens and form feeds
+        that multi_cell breaks lines at.
+        """
+        font = self.current_font
+        if font.fontkey != self.listing_fontkey:
+            return False
+        if self.fixed_advance is None:
+            return chars.isdisjoint('\u00ad\f')
+        return all(font.cw[ord(char)] == self.fixed_advance for char in chars)
+
+    def write_listing(self, pieces, line_height=5):
+        """
+        Emits the pages of layout_listing(pieces) into this document.
+        """
+        for text_object, page_full in self.layout_listing(pieces, line_height):
+            self.emit_listing_page(text_object, page_full)
+
+    def emit_listing_page(self, text_object, page_full):
+        """
+        Writes one page of a listing and starts the next page if the listing continues.
+        """
+        if text_object:
+            self._out(text_object)
+        if page_full:
+            self.add_page(same=True)
+
+    def layout_listing(self, pieces, line_height=5, code_map=None):
+        """
+        Lays out a code listing in the listing font, starting at the current position.
+
+        pieces yields (text, ends_line) pairs; a line may arrive in several pieces, which are
+        wrapped as if the line came whole, and the blank row that follows every line is only
+        added after its last piece. Yields
+        (text object, page_full) for each page, where page_full means the listing continues
+        on a new page. Callers emit the text object and start that page themselves, which
+        lets stream_file_to_pdf write pages out without keeping them in memory. code_map is the
+        _SubsetCodeMap to encode with; pass one to see which codepoints the listing used.
+
+        Fixed-pitch fonts wrap on character counts. Proportional fonts wrap on the font's
+        glyph width table, with repeated lines served from WRAP_CACHE.
+        """
+        if code_map is None:
+            code_map = _SubsetCodeMap(self.current_font.subset)
+        usable_width = self.w - self.r_margin - self.x - 2 * self.c_margin
+        if self.fixed_advance:
+            char_width = self.fixed_advance * self.font_size / 1000
+            columns = max(1, int(usable_width / char_width + 1e-9))
+            wrap = functools.partial(_wrap_columns, columns=columns)
+        else:
+            limit = usable_width * 1000 / self.font_size + 1e-9
+            wrap = WRAP_CACHE.wrapper(self.font_id, self.advances, self.current_font.cw.default_factory(), limit)
+        x_pt = (self.x + self.c_margin) * self.k
+        baseline_offset = 0.5 * line_height + 0.3 * self.font_size
+
+        y = self.y
+        page_ops = []
+        previous_y_pt = None
+        carry = ''
+        for text, ends_line in pieces:
+            text = carry + text
+            rows = wrap(text)
+            carry = ''
+            if not ends_line:
+                # The last row is wrapped again with the rest of its line; rows only drop the
+                # space they break at, so its start is found by walking the rows before it
+                rows = rows[:-1]
+                start = 0
+                for row in rows:
+                    start += len(row)
+                    if text.startswith(' ', start):
+                        start += 1
+                carry = text[start:]
+            for row in rows:
+                if y > self.t_margin and y + line_height > self.page_break_trigger:
+                    yield _listing_text_object(page_ops), True
+                    page_ops = []
+                    previous_y_pt = None
+                    y = self.t_margin
+                encoded = row.translate(code_map)
+                if encoded:
+                    y_pt = round((self.h - y - baseline_offset) * self.k, 2)
+                    if previous_y_pt is None:
+                        page_ops.append(f"{x_pt:.2f} {y_pt:.2f} Td".encode('latin-1'))
+                    else:
+                        page_ops.append(f"0 {y_pt - previous_y_pt:.2f} Td".encode('latin-1'))
+                    previous_y_pt = y_pt
+                    page_ops.append(b'(' + _escape_pdf_string(encoded.encode('utf-16-be')) + b') Tj')
+                y += line_height
+            # Equivalent of the ln() after each multi_cell
+            if ends_line:
+                y += line_height
+
+        self.x = self.l_margin
+        self.y = y
+        self.lasth = line_height
+        yield _listing_text_object(page_ops), False
+
+class SourceFile:
+    """
+    A source file opened once for everything needed to render it.
+
+    The size comes from fstat on the open descriptor and the binary sniff looks at the
+    first block; read_text() decodes that block plus the rest of the file from memory, so
+    the replacement-character fallback never goes back to disk. An OSError raised while
+    opening is kept and re-raised by read_text(), which render_file reports in the PDF.
+    """
+    def __init__(self, file_path):
+        self.path = file_path
+        self.size = 0
+        self.head = b''
+        self.error = None
+        self._file = None
+        self._map = None
+        self._digest = None
+        try:
+            self._file = open(file_path, 'rb')
+            self.size = os.fstat(self._file.fileno()).st_size
+            self.head = self._file.read(SNIFF_SIZE)
+        except OSError as e:
+            self.error = e
+            self.close()
+        # Binary files have a null byte in their first block
+        self.is_binary = b'\0' in self.head
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read_text(self):
+        """
+        Returns the whole content decoded as UTF-8, with invalid bytes replaced,
+        and line endings translated like text-mode open() does.
+        """
+        if self.error is not None:
+            raise self.error
+        if self._map is not None:
+            data = self._map[:]
+        else:
+            rest = self._file.read()
+            data = self.head + rest if rest else self.head
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            # If UTF-8 fails, decode the same bytes with replacement characters
+            text = data.decode('utf-8', errors='replace')
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+
+    def _mapped(self):
+        """
+        Returns the content as a read-only memory map, or as bytes if the file cannot be
+        mapped (mmap refuses empty files, for one).
+        """
+        if self.error is not None:
+            raise self.error
+        if self._map is None:
+            try:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    self._map.madvise(mmap.MADV_SEQUENTIAL)
+            except (OSError, ValueError):
+                self._file.seek(0)
+                self._map = self._file.read()
+        return self._map
+
+    def _release(self, data, released, offset):
+        """
+        Drops the mapped pages below offset that were already decoded from the process's
+        resident set (they stay in the page cache). Returns the new released offset.
+        """
+        if offset - released < MMAP_RELEASE_BYTES or not isinstance(data, mmap.mmap):
+            return released
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return released
+        offset -= offset % mmap.PAGESIZE
+        data.madvise(mmap.MADV_DONTNEED, released, offset - released)
+        return offset
+
+    def lines(self, limit=None):
+        """
+        Yields (text, ends_line) for each line of the content, decoded like read_text() one
+        line at a time from the memory map, so the file never exists as a single str.
+        The lines are those of read_text().split('\n'). Lines longer than limit bytes come
+        out in pieces, with ends_line False for all but the last piece.
+        """
+        data = self._mapped()
+        size = len(data)
+        pos = released = 0
+        while True:
+            newline = data.find(b'\n', pos)
+            stop = size if newline < 0 else newline
+            while True:
+                cut = stop
+                if limit is not None and stop - pos > limit:
+                    # Back up to the start of a UTF-8 sequence so no character is split
+                    cut = pos + limit
+                    while cut > pos + 1 and data[cut] & 0xC0 == 0x80:
+                        cut -= 1
+                text = data[pos:cut].decode('utf-8', errors='replace')
+                ends_line = cut == stop
+                if ends_line and newline >= 0 and text.endswith('\r'):
+                    text = text[:-1]
+                if '\r' in text:
+                    # A lone carriage return ends a line, as in text mode
+                    *rows, text = text.split('\r')
+                    for row in rows:
+                        yield row, True
+                yield text, ends_line
+                pos = cut
+                if ends_line:
+                    break
+            if newline < 0:
+                return
+            pos = newline + 1
+            released = self._release(data, released, pos)
+
+    def digest(self):
+        """
+        Returns the SHA-256 hex digest of the content, hashed from the memory map.
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha256(self._mapped()).hexdigest()
+        return self._digest
+
+    def characters(self):
+        """
+        Returns the set of characters in the decoded content, without line breaks and with
+        tabs counted as the spaces they expand to. Decodes the memory map in blocks.
+        """
+        data = self._mapped()
+        size = len(data)
+        chars = set()
+        pos = released = 0
+        while pos < size:
+            cut = min(pos + MMAP_SCAN_BLOCK, size)
+            # Back up to the start of a UTF-8 sequence so no character is split
+            while pos + 1 < cut < size and data[cut] & 0xC0 == 0x80:
+                cut -= 1
+            chars.update(data[pos:cut].decode('utf-8', errors='replace'))
+            pos = cut
+            released = self._release(data, released, pos)
+        chars.discard('\n')
+        chars.discard('\r')
+        if '\t' in chars:
+            chars.discard('\t')
+            chars.add(' ')
+        return chars
+
+def render_file(pdf, source, base_folder):
+    """
+    Renders a single file into pdf: the file location header followed by its content.
+    source is the file's SourceFile, whose content add_source lays out from its memory map,
+    so files above MAX_FILE_SIZE are rendered too (process_file streams those instead).
+    Returns True once the file is rendered, False without rendering anything for binary
+    files and files above MAX_STREAM_FILE_SIZE, which get no PDF, or None if reading the
+    file failed and an error message was rendered in place of its content.
+    """
+    file_path = source.path
+    # Determine if the file is binary
+    if source.is_binary:
+        logging.info(f"Skipped binary file: {file_path}")
+        return False
+    # Determine if the file exceeds the maximum size
+    if MAX_STREAM_FILE_SIZE is not None and source.size > MAX_STREAM_FILE_SIZE:
+        logging.info(f"Skipped large file: {file_path}")
+        return False
+
+    relative_path = os.path.relpath(file_path, base_folder)
+    display_path = relative_path.replace(os.sep, ' > ')
+    pdf.start_file()
+
+    # Add the file location as the first line
+    pdf.add_text(f"File Location: {base_folder} > {display_path}\n\n")
+
+    try:
+        pdf.add_source(source)
+    except Exception as e:
+        pdf.add_text(f"**Error reading file: {e}**")
+        logging.error(f"Error reading file {file_path}: {e}")
+        return None
+    return True
+
+@profiled('collect_codepoints')
+def collect_codepoints(file_paths, base_folder, tree=None):
+    """
+    Returns the codepoints rendering file_paths uses, for --shared-subset: the characters
+    of every text file and its file location header, the names in tree (the scan_tree
+    index, for the structure PDF) and SHARED_SUBSET_EXTRA. Text only produced while
+    rendering, like error messages, may still fall outside it.
+    """
+    codepoints = set(map(ord, SHARED_SUBSET_EXTRA))
+    codepoints.update(map(ord, base_folder))
+    for file_path in file_paths:
+        codepoints.update(map(ord, os.path.relpath(file_path, base_folder)))
+        with SourceFile(file_path) as source:
+            if source.is_binary or source.error is not None:
+                continue
+            # Too large to stream, so skipped when rendering
+            if MAX_STREAM_FILE_SIZE is not None and source.size > MAX_STREAM_FILE_SIZE:
+                continue
+            codepoints.update(map(ord, source.characters()))
+    stack = [tree] if tree is not None else []
+    while stack:
+        node = stack.pop()
+        codepoints.update(map(ord, node.name))
+        stack.extend(node.children or ())
+    return codepoints
+
+class TreeEntry:
+    """
+    A file or directory in the in-memory index built by scan_tree.
+    Directories have a sorted list of children; files carry their cached stat result.
+    """
+    __slots__ = ('name', 'path', 'stat', 'children', 'error')
+
+    def __init__(self, name, path, stat=None, children=None):
+        self.name = name
+        self.path = path
+        self.stat = stat
+        self.children = children
+        self.error = False
+
+    @property
+    def is_dir(self):
+        return self.children is not None
+
+@profiled('scan_tree')
+def scan_tree(input_folder, gitignore=False, path_filter=None):
+    """
+    Indexes input_folder with a single os.scandir pass, applying path_filter (a PathFilter,
+    by default the one of FILTERS).
+
+    Folders the filter leaves out are not descended into. Symlinked directories are listed
+    but not descended into, like os.walk. Directories that cannot be read are flagged
+    with error=True. With gitignore=True, paths ignored by the .gitignore files of the
+    folder and its repository (see GitIgnore) are left out too, and ignored folders are
+    not descended into.
+    """
+    if path_filter is None:
+        path_filter = PathFilter(FILTERS)
+    root = TreeEntry(os.path.basename(os.path.abspath(input_folder)), input_folder, children=[])
+    # Each folder comes with its path relative to input_folder, its path relative to the matchers'
+    # root and the GitIgnore matchers that apply to it, as (folder of the .gitignore relative to
+    # that root, matcher) pairs
+    if gitignore:
+        root_path, chain = _gitignore_chain(input_folder)
+    else:
+        root_path, chain = '', None
+    stack = [(root, '', root_path, chain)]
+    while stack:
+        node, relative, node_path, chain = stack.pop()
+        try:
+            with os.scandir(node.path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            node.error = True
+            continue
+        if chain is not None:
+            ignore = GitIgnore.from_file(os.path.join(node.path, '.gitignore'))
+            if ignore is not None:
+                chain = chain + [(node_path, ignore)]
+        for entry in entries:
+            is_dir = entry.is_dir()
+            entry_relative = relative + entry.name
+            if path_filter.skip_folder(entry_relative) if is_dir else path_filter.skip_file(entry_relative):
+                continue
+            entry_path = node_path + entry.name
+            if chain and _gitignored(chain, entry_path, is_dir):
+                continue
+            if is_dir:
+                child = TreeEntry(entry.name, entry.path, children=[])
+                if not entry.is_symlink():
+                    stack.append((child, entry_relative + '/', entry_path + '/', chain))
+            else:
+                try:
+                    child = TreeEntry(entry.name, entry.path, stat=entry.stat())
+                except OSError as e:
+                    logging.error(f"Cannot stat {entry.path}: {e}")
+                    continue
+                if path_filter.checks_stat and path_filter.skip_stat(child.stat):
+                    continue
+            node.children.append(child)
+    return root
+
+def _glob_to_regex(pattern):
+    """
+    Translates a gitignore glob to a regular expression over '/'-separated paths: '*' and
+    '?' do not match '/', a '**' segment matches any number of folders, a trailing '/**'
+    matches everything below the folder but not the folder itself, [...] is a character
+    class and a backslash escapes the next character.
+    """
+    parts = []
+    i = 0
+    size = len(pattern)
+    while i < size:
+        char = pattern[i]
+        if char == '*':
+            segment_start = i == 0 or pattern[i - 1] == '/'
+            if segment_start and pattern.startswith('**/', i):
+                parts.append('(?:.*/)?')
+                i += 3
+                continue
+            if segment_start and pattern.startswith('**', i) and i + 2 == size:
+                parts.append('.+')
+                i += 2
+                continue
+            while i + 1 < size and pattern[i + 1] == '*':
+                i += 1
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        elif char == '[':
+            end = i + 1
+            if end < size and pattern[end] in '!^':
+                end += 1
+            if end < size and pattern[end] == ']':
+                end += 1
+            end = pattern.find(']', end)
+            if end < 0:
+                parts.append('\\[')
+            else:
+                body = pattern[i + 1:end].replace('\\', '\\\\')
+                if body[0] in '!^':
+                    body = '^/' + body[1:]
+                parts.append(f'[{body}]')
+                i = end
+        elif char == '\\' and i + 1 < size:
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return ''.join(parts)
+
+def _glob_rule(pattern, descendants=False):
+    """
+    Translates one .gitignore pattern (without a leading '!') to a regular expression over
+    whole '/'-separated paths, where folders end with '/'. A trailing slash restricts the
+    pattern to folders and a slash anywhere else anchors it to the root; otherwise it matches
+    the name at any depth. With descendants=True it also matches every path below a matching
+    folder. Returns None for an empty pattern.
+    """
+    dir_only = pattern.endswith('/')
+    if dir_only:
+        pattern = pattern[:-1]
+    if not pattern:
+        return None
+    anchored = '/' in pattern
+    if pattern.startswith('/'):
+        pattern = pattern[1:]
+    regex = _glob_to_regex(pattern)
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+    if descendants:
+        return regex + ('/.*' if dir_only else '(?:/.*)?')
+    return regex + ('/' if dir_only else '/?')
+
+class GitIgnore:
+    """
+    The patterns of one .gitignore (or info/exclude) file, compiled into one regular expression.
+
+    Every pattern becomes a capturing alternative, last pattern first, so the alternative that
+    matches is the pattern git applies and its group number says whether it was negated.
+    Matching a path is then a single regex match, whatever the number of patterns.
+    """
+
+    def __init__(self, lines):
+        rules = []
+        for line in lines:
+            line = line.rstrip('\r\n')
+            # Trailing spaces are ignored unless escaped
+            while line.endswith(' ') and not line.endswith('\\ '):
+                line = line[:-1]
+            if not line or line.startswith('#'):
+                continue
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+            regex = _glob_rule(line)
+            if regex is not None:
+                rules.append((regex, negated))
+        rules.reverse()
+        self._negated = [None] + [negated for _, negated in rules]
+        self._regex = re.compile('|'.join(f'({regex})' for regex, _ in rules), re.DOTALL) if rules else None
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Reads the patterns in path. Returns None if the file does not exist or has none.
+        """
+        try:
+            with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                ignore = cls(f)
+        except OSError:
+            return None
+        return ignore if ignore._regex is not None else None
+
+    def match(self, path, is_dir):
+        """
+        Returns True if path ('/'-separated, relative to the .gitignore's folder) is ignored,
+        False if a negated pattern includes it again, or None if no pattern matches it.
+        """
+        match = self._regex.fullmatch(path + '/' if is_dir else path)
+        if match is None:
+            return None
+        return not self._negated[match.lastindex]
+
+def _gitignored(chain, path, is_dir):
+    """
+    Whether path is ignored by the matchers in chain, as built by scan_tree.
+    The .gitignore closest to the path decides.
+    """
+    for base, ignore in reversed(chain):
+        result = ignore.match(path[len(base):], is_dir)
+        if result is not None:
+            return result
+    return False
+
+class PathFilter:
+    """
+    The include and exclude rules of discovery (see FILTERS), compiled once per run.
+
+    Globs follow .gitignore syntax (see _glob_rule), extensions match the end of file names
+    in any case, and regexes are searched in the path; paths are '/'-separated and relative
+    to the input folder. All exclude rules are combined into one regular expression and all
+    include rules into another, so checking an entry is a single match over its path
+    whatever the number of rules. Excluded folders are pruned with everything below them,
+    and when every include rule is an anchored glob, so are the folders outside the literal
+    folders those globs start with. Include rules, sizes and modification times only
+    apply to files.
+    """
+
+    SETTINGS = ('exclude', 'include', 'min_size', 'max_size', 'modified_after', 'modified_before')
+    RULE_KINDS = ('globs', 'extensions', 'regexes')
+
+    def __init__(self, config):
+        unknown = set(config) - set(self.SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown filter settings: {', '.join(sorted(unknown))}")
+        exclude = config.get('exclude') or {}
+        include = config.get('include') or {}
+        self.exclude = self._compile(exclude, descendants=False)
+        # An included folder includes the files below it
+        self.include = self._compile(include, descendants=True)
+        self.min_size = self._size(config.get('min_size'))
+        self.max_size = self._size(config.get('max_size'))
+        self.modified_after = self._timestamp(config.get('modified_after'))
+        self.modified_before = self._timestamp(config.get('modified_before'))
+        self.checks_stat = any(limit is not None for limit in (self.min_size, self.max_size,
+                                                               self.modified_after, self.modified_before))
+        # The folders every included file is under, or None if an include rule can match anywhere
+        self._include_prefixes = None
+        if self.include is not None and not include.get('extensions') and not include.get('regexes'):
+            prefixes = []
+            for glob in include.get('globs', []):
+                if '/' not in glob.rstrip('/'):
+                    break
+                segments = glob.lstrip('/').split('/')[:-1]
+                literal = []
+                for segment in segments:
+                    if any(char in segment for char in '*?[\\'):
+                        break
+                    literal.append(segment + '/')
+                prefixes.append(''.join(literal))
+            else:
+                self._include_prefixes = prefixes
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Returns the filter of FILTERS with the settings of the JSON file at path added: its
+        pattern lists extend the defaults and its other settings replace them, unless it sets
+        "inherit": false to start from no rules at all. Raises OSError or ValueError.
+        """
+        config = copy.deepcopy(FILTERS)
+        if path is None:
+            return cls(config)
+        with open(path, 'r', encoding='utf-8') as f:
+            settings = json.load(f)
+        if not isinstance(settings, dict):
+            raise ValueError("expected a JSON object")
+        if not settings.pop('inherit', True):
+            config = {}
+        for key, value in settings.items():
+            if key not in ('exclude', 'include'):
+                config[key] = value
+                continue
+            if not isinstance(value, dict):
+                raise ValueError(f"'{key}' must be an object with {', '.join(cls.RULE_KINDS)} lists")
+            rules = config.setdefault(key, {})
+            for kind, patterns in value.items():
+                if not isinstance(patterns, list):
+                    raise ValueError(f"'{key}.{kind}' must be a list")
+                rules[kind] = rules.get(kind, []) + patterns
+        return cls(config)
+
+    @classmethod
+    def _compile(cls, rules, descendants):
+        unknown = set(rules) - set(cls.RULE_KINDS)
+        if unknown:
+            raise ValueError(f"unknown pattern kinds: {', '.join(sorted(unknown))}")
+        alternatives = []
+        for glob in rules.get('globs', []):
+            regex = _glob_rule(glob, descendants)
+            if regex is not None:
+                alternatives.append(regex)
+        extensions = [extension.lstrip('.') for extension in rules.get('extensions', []) if extension.lstrip('.')]
+        if extensions:
+            alternatives.append('.*\\.(?i:' + '|'.join(map(re.escape, extensions)) + ')')
+        for regex in rules.get('regexes', []):
+            try:
+                re.compile(regex)
+            except re.error as e:
+                raise ValueError(f"invalid regex '{regex}': {e}") from e
+            alternatives.append(f'.*?(?:{regex}).*')
+        if not alternatives:
+            return None
+        return re.compile('|'.join(f'(?:{regex})' for regex in alternatives), re.DOTALL)
+
+    @staticmethod
+    def _size(value):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            raise ValueError(f"size limits are numbers of bytes, not {value!r}")
+        return value
+
+    @staticmethod
+    def _timestamp(value):
+        # Dates and datetimes without a time zone are local time, like file modification times
+        if value is None:
+            return None
+        if not isinstance(value, str):
+            raise ValueError(f"modification times are ISO dates or datetimes, not {value!r}")
+        return datetime.fromisoformat(value).timestamp()
+
+    def skip_folder(self, path):
+        """
+        Whether the folder at path is left out, with everything below it.
+        """
+        path += '/'
+        if self.exclude is not None and self.exclude.fullmatch(path):
+            return True
+        if self._include_prefixes is not None:
+            return not any(path.startswith(prefix) or prefix.startswith(path) for prefix in self._include_prefixes)
+        return False
+
+    def skip_file(self, path):
+        """
+        Whether the file at path is left out by its path.
+        """
+        if self.exclude is not None and self.exclude.fullmatch(path):
+            return True
+        return self.include is not None and self.include.fullmatch(path) is None
+
+    def skip_stat(self, st):
+        """
+        Whether a file is left out by its size or modification time.
+        """
+        return ((self.min_size is not None and st.st_size < self.min_size)
+                or (self.max_size is not None and st.st_size > self.max_size)
+                or (self.modified_after is not None and st.st_mtime < self.modified_after)
+                or (self.modified_before is not None and st.st_mtime > self.modified_before))
+
+def find_git_dir(folder):
+    """
+    Returns (work tree root, git dir) of the git repository containing folder, or None.
+    A .git file, as in linked worktrees and submodules, points at the git dir.
+    """
+    path = os.path.abspath(folder)
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            return path, dot_git
+        if os.path.isfile(dot_git):
+            try:
+                with open(dot_git, 'r', encoding='utf-8') as f:
+                    content = f.read().strip()
+            except OSError:
+                content = ''
+            if content.startswith('gitdir:'):
+                return path, os.path.normpath(os.path.join(path, content[len('gitdir:'):].strip()))
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+def _gitignore_chain(input_folder):
+    """
+    Returns (path of input_folder relative to the matchers' root, matchers) for scan_tree:
+    the repository's info/exclude and the .gitignore files of the folders between the
+    repository root and input_folder. Outside a repository, input_folder is the root.
+    """
+    found = find_git_dir(input_folder)
+    if found is None:
+        return '', []
+    work_tree, git_dir = found
+    chain = []
+    ignore = GitIgnore.from_file(os.path.join(git_dir, 'info', 'exclude'))
+    if ignore is not None:
+        chain.append(('', ignore))
+    relative = os.path.relpath(os.path.abspath(input_folder), work_tree)
+    parts = [] if relative == '.' else relative.split(os.sep)
+    # input_folder's own .gitignore is read by scan_tree
+    for depth in range(len(parts)):
+        ignore = GitIgnore.from_file(os.path.join(work_tree, *parts[:depth], '.gitignore'))
+        if ignore is not None:
+            chain.append((''.join(part + '/' for part in parts[:depth]), ignore))
+    return ''.join(part + '/' for part in parts), chain
+
+def _git_hash_size(git_dir):
+    """
+    Returns the object ID size of the repository: 32 bytes for SHA-256 repositories, else 20.
+    """
+    config_dir = git_dir
+    try:
+        # Linked worktrees keep the config in the common git dir
+        with open(os.path.join(git_dir, 'commondir'), 'r', encoding='utf-8') as f:
+            config_dir = os.path.join(git_dir, f.read().strip())
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(config_dir, 'config'), 'r', encoding='utf-8', errors='replace') as f:
+            config = f.read()
+    except OSError:
+        return 20
+    return 32 if re.search(r'^\s*objectformat\s*=\s*sha256\s*$', config, re.IGNORECASE | re.MULTILINE) else 20
+
+def read_git_index(git_dir):
+    """
+    Returns the '/'-separated paths of the files tracked in git_dir's index, in index order.
+
+    Reads index versions 2 to 4 directly, without running git. Submodules, sparse-checkout
+    entries outside the work tree and the extra stages of merge conflicts are left out.
+    Raises ValueError if the file is not a git index.
+    """
+    with open(os.path.join(git_dir, 'index'), 'rb') as f:
+        data = f.read()
+    signature, version, count = struct.unpack_from('>4sLL', data)
+    if signature != b'DIRC' or version not in (2, 3, 4):
+        raise ValueError(f"unsupported git index (signature {signature!r}, version {version})")
+    hash_size = _git_hash_size(git_dir)
+    # Entries start with ten 32-bit stat fields and the object ID, followed by 16 bits of flags
+    flags_offset = 40 + hash_size
+    paths = []
+    previous = b''
+    offset = 12
+    for _ in range(count):
+        mode, = struct.unpack_from('>L', data, offset + 24)
+        flags, = struct.unpack_from('>H', data, offset + flags_offset)
+        position = offset + flags_offset + 2
+        skip_worktree = False
+        if flags & 0x4000:
+            extended_flags, = struct.unpack_from('>H', data, position)
+            skip_worktree = bool(extended_flags & 0x4000)
+            position += 2
+        if version == 4:
+            # The path is prefix-compressed against the previous entry's path
+            strip = data[position] & 0x7F
+            while data[position] & 0x80:
+                position += 1
+                strip = ((strip + 1) << 7) | (data[position] & 0x7F)
+            position += 1
+            end = data.index(b'\0', position)
+            path = previous[:len(previous) - strip] + data[position:end]
+            offset = end + 1
+        else:
+            end = data.index(b'\0', position)
+            path = data[position:end]
+            # Entries are padded with 1 to 8 NUL bytes to a multiple of 8 bytes
+            offset += (end - offset + 8) & ~7
+        if path == previous and paths:
+            continue
+        previous = path
+        # Regular files and symlinks only: not submodules or sparse directory entries
+        if mode >> 12 not in (0o10, 0o12) or skip_worktree:
+            continue
+        paths.append(path.decode('utf-8', errors='surrogateescape'))
+    return paths
+
+@profiled('scan_tree')
+def scan_git_index(input_folder, path_filter=None):
+    """
+    Indexes the files of input_folder tracked by its git repository, read from the index
+    (see read_git_index) instead of walking the folder, applying path_filter like
+    scan_tree. Folders are built from the tracked paths, so untracked and ignored folders
+    are never visited. Returns None if input_folder is not in a git repository or the index
+    cannot be read.
+    """
+    found = find_git_dir(input_folder)
+    if found is None:
+        return None
+    work_tree, git_dir = found
+    try:
+        paths = read_git_index(git_dir)
+    except (OSError, ValueError, struct.error) as e:
+        logging.error(f"Cannot read the git index of '{work_tree}': {e}")
+        return None
+    relative = os.path.relpath(os.path.abspath(input_folder), work_tree)
+    prefix = '' if relative == '.' else relative.replace(os.sep, '/') + '/'
+
+    if path_filter is None:
+        path_filter = PathFilter(FILTERS)
+    root = TreeEntry(os.path.basename(os.path.abspath(input_folder)), input_folder, children=[])
+    # Folder paths relative to input_folder -> TreeEntry, or None for skipped folders
+    folders = {'': root}
+    root_prefix = os.path.join(input_folder, '')
+
+    def child_path(node, name):
+        return (root_prefix if node is root else node.path + os.sep) + name
+
+    def folder_node(folder):
+        parent_folder, _, name = folder.rpartition('/')
+        parent = folders.get(parent_folder, False)
+        if parent is False:
+            parent = folder_node(parent_folder)
+        node = None
+        if parent is not None and not path_filter.skip_folder(folder):
+            node = TreeEntry(name, child_path(parent, name), children=[])
+            parent.children.append(node)
+        folders[folder] = node
+        return node
+
+    for path in paths:
+        if not path.startswith(prefix):
+            continue
+        relative_path = path[len(prefix):]
+        folder, _, name = relative_path.rpartition('/')
+        node = folders.get(folder, False)
+        if node is False:
+            node = folder_node(folder)
+        if node is None or path_filter.skip_file(relative_path):
+            continue
+        file_path = child_path(node, name)
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            # Deleted from the work tree but not from the index
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            # A symlink to a folder: listed but not descended into, like scan_tree
+            if not path_filter.skip_folder(relative_path):
+                node.children.append(TreeEntry(name, file_path, children=[]))
+        elif not (path_filter.checks_stat and path_filter.skip_stat(st)):
+            node.children.append(TreeEntry(name, file_path, stat=st))
+    # The index sorts 'a.txt' before the files of folder 'a' ('.' < '/'); scan_tree sorts by name
+    for node in folders.values():
+        if node is not None:
+            node.children.sort(key=lambda child: child.name)
+    return root
+
+def tree_files(node):
+    """
+    Returns the (path, stat) pairs of every file under node, in os.walk order:
+    each directory's files first, then its subdirectories, all sorted by name.
+    """
+    files = []
+    stack = [node]
+    while stack:
+        directory = stack.pop()
+        files.extend((child.path, child.stat) for child in directory.children if not child.is_dir)
+        stack.extend(reversed([child for child in directory.children if child.is_dir]))
+    return files
+
+def individual_pdf_path(file_path, base_folder, output_folder):
+    """
+    Returns the path of the individual PDF for file_path.
+    """
+    relative_path = os.path.relpath(file_path, base_folder)
+    return Path(output_folder) / Path(relative_path).with_suffix('.pdf')
+
+def _streamed_size(size):
+    """
+    Whether a text file of size bytes is streamed rather than rendered in memory.
+    """
+    return size > MAX_FILE_SIZE and (MAX_STREAM_FILE_SIZE is None or size <= MAX_STREAM_FILE_SIZE)
+
+def _should_stream(source):
+    """
+    Large text files are streamed with the bulk listing layout.
+    """
+    return _streamed_size(source.size) and not source.is_binary
+
+def stream_file_to_pdf(pdf, source, base_folder, output_pdf_path, optimize=None):
+    """
+    Renders a file too large to hold in memory straight to output_pdf_path.
+
+    The file is decoded line by line from its memory map and laid out with pdf.layout_listing;
+    each page's content stream is written out as soon as the page is full, so memory stays
+    bounded whatever the file size. pdf only supplies the page geometry and the font subset,
+    which is embedded once at the end. Lines longer than STREAM_LINE_LIMIT bytes are laid
+    out in pieces. optimize is the deflate level of --optimize (see PdfObjectWriter).
+    """
+    import_pypdf2()
+    relative_path = os.path.relpath(source.path, base_folder)
+    display_path = relative_path.replace(os.sep, ' > ')
+
+    def pieces():
+        # Same rows as add_text(f"File Location: ...\n\n") followed by add_text(content)
+        yield f"File Location: {base_folder} > {display_path}", True
+        yield '', True
+        yield '', True
+        column = 0
+        for line, ends_line in source.lines(STREAM_LINE_LIMIT):
+            # Tab stops count from the start of the line, not of the piece
+            shift = column % 4
+            line = (' ' * shift + line).expandtabs(4)[shift:]
+            column = 0 if ends_line else column + len(line)
+            yield line, ends_line
+
+    font_resource = f"/F{pdf.current_font.i}"
+    font_selection = f"BT {font_resource} {pdf.font_size_pt:.2f} Tf ET\n".encode('latin-1')
+    media_box = ArrayObject([NumberObject(0), NumberObject(0),
+                             FloatObject(round(pdf.w * pdf.k, 2)), FloatObject(round(pdf.h * pdf.k, 2))])
+
+    with open(output_pdf_path, 'wb') as f_out:
+        writer = PdfObjectWriter(f_out, optimize=optimize)
+        writer.write_header()
+        pages_ref = writer.allocate()
+        resources_ref = writer.allocate()
+        font_ref = writer.allocate()
+        kids = ArrayObject()
+        for text_object, _ in pdf.layout_listing(pieces()):
+            content = StreamObject()
+            content._data = zlib.compress(font_selection + text_object)
+            content[NameObject('/Filter')] = NameObject('/FlateDecode')
+            content_ref = writer.allocate()
+            writer.write(content_ref, content)
+            page_ref = writer.allocate()
+            writer.write(page_ref, DictionaryObject({
+                NameObject('/Type'): NameObject('/Page'),
+                NameObject('/Parent'): pages_ref,
+                NameObject('/MediaBox'): media_box,
+                NameObject('/Resources'): resources_ref,
+                NameObject('/Contents'): content_ref,
+            }))
+            kids.append(page_ref)
+
+        writer.write(font_ref, writer.copy(_extract_font_dict(pdf)))
+        writer.forget_sources()
+        writer.write(resources_ref, DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject(font_resource): font_ref}),
+            NameObject('/ProcSet'): ArrayObject([NameObject('/PDF'), NameObject('/Text')]),
+        }))
+        writer.write(pages_ref, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): kids,
+            NameObject('/Count'): NumberObject(len(kids)),
+        }))
+        catalog_ref = writer.allocate()
+        writer.write(catalog_ref, DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): pages_ref,
+        }))
+        writer.write_xref(DictionaryObject({NameObject('/Root'): catalog_ref}))
+        if optimize is not None:
+            SIZE_REPORT.add('individual PDFs', writer.plain_size, f_out.tell())
+    return len(kids)
+
+def process_file(file_path, base_folder, output_folder, font_path, font_name='CustomFont', creation_date=None,
+                 optimize=None):
+    """
+    Processes a single file: reads its content and creates a PDF.
+    Files larger than MAX_FILE_SIZE are streamed to disk page by page.
+    optimize is the deflate level of --optimize, or None to write the PDF as fpdf2 does.
+    Returns the number of pages written, 0 if the file gets no PDF (binary or oversized
+    files), or None if it failed: its PDF could not be written or shows an error message
+    instead of its content. A PDF left from an earlier run is deleted when no PDF is written.
+    """
+    if not PROFILER.enabled:
+        return _process_file(file_path, base_folder, output_folder, font_path, font_name, creation_date, optimize)
+
+    start = time.perf_counter()
+    with PROFILER.phase('process_file'):
+        pages = _process_file(file_path, base_folder, output_folder, font_path, font_name, creation_date, optimize)
+    seconds = time.perf_counter() - start
+
+    # Skipped files only had their first SNIFF_SIZE bytes read by SourceFile.is_binary
+    size = os.path.getsize(file_path)
+    bytes_read = size if pages else min(size, SNIFF_SIZE)
+    output_pdf_path = individual_pdf_path(file_path, base_folder, output_folder)
+    bytes_written = output_pdf_path.stat().st_size if output_pdf_path.exists() else 0
+    PROFILER.record_file(file_path, seconds, bytes_read, bytes_written, pages or 0)
+    return pages
+
+def _discard_pdf(output_pdf_path):
+    """
+    Deletes the PDF an earlier run left at output_pdf_path for a file that gets none now.
+    """
+    try:
+        output_pdf_path.unlink(missing_ok=True)
+    except OSError as e:
+        logging.error(f"Failed to delete stale PDF {output_pdf_path}: {e}")
+
+def _process_file(file_path, base_folder, output_folder, font_path, font_name='CustomFont', creation_date=None,
+                  optimize=None):
+    """
+    Does the work of process_file.
+    """
+    pdf = PDF(font_path, font_name, creation_date)
+
+    # Define the output PDF path
+    output_pdf_path = individual_pdf_path(file_path, base_folder, output_folder)
 
-def install(package):
-    """
-    Helper function to install packages if they're missing.
-    """
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+    with SourceFile(file_path) as source:
+        if _should_stream(source):
+            output_pdf_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                pages = stream_file_to_pdf(pdf, source, base_folder, output_pdf_path, optimize)
+                logging.info(f"Successfully created PDF for {file_path} (streamed {pages} pages)")
+            except Exception as e:
+                _discard_pdf(output_pdf_path)
+                logging.error(f"Failed to write PDF for {file_path}: {e}")
+                print(f"Failed to write PDF for {file_path}: {e}")
+                return None
+            return pages
 
-# Ensure required packages are installed
-try:
-    from fpdf import FPDF
-except ImportError:
-    print("fpdf2 not found. Installing...")
-    install('fpdf2')
-    from fpdf import FPDF
+        rendered = render_file(pdf, source, base_folder)
+        if rendered is False:
+            # The file may have had a PDF before it became binary or too large
+            _discard_pdf(output_pdf_path)
+            return 0
 
-try:
-    from tqdm import tqdm
-except ImportError:
-    print("tqdm not found. Installing...")
-    install('tqdm')
-    from tqdm import tqdm
+    # Ensure the output directory exists
+    output_pdf_path.parent.mkdir(parents=True, exist_ok=True)
 
-try:
-    from PyPDF2 import PdfReader, PdfWriter
-except ImportError:
-    print("PyPDF2 not found. Installing...")
-    install('PyPDF2')
-    from PyPDF2 import PdfReader, PdfWriter
+    # Save the PDF
+    try:
+        write_pdf(pdf, output_pdf_path, optimize)
+        logging.info(f"Successfully created PDF for {file_path}")
+    except Exception as e:
+        _discard_pdf(output_pdf_path)
+        logging.error(f"Failed to write PDF for {file_path}: {e}")
+        print(f"Failed to write PDF for {file_path}: {e}")
+        return None
+    return pdf.pages_count if rendered else None
 
-# Configure logging
-logging.basicConfig(
-    filename='pdf_conversion.log',
-    level=logging.INFO,
-    format='%(asctime)s:%(levelname)s:%(message)s'
-)
+def file_digest(file_path):
+    """
+    Returns the SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-# Configuration
-# Define skip lists
-SKIP_FOLDERS = ['.git', '__pycache__', 'node_modules', 'local_tiktoken_cache']  # Add folders you want to skip
-SKIP_FILES = ['.dockerignore', 'README.md', 'generic.pdf', 'with_cabin.pdf','template_EN.pdf','modified_template.pdf','CALIBRI.ttf','CALIBRIB.ttf']    # Add files you want to skip
-MAX_FILE_SIZE = 2 * 1024 * 1024  # Maximum file size in bytes (e.g., 5MB)
+def settings_fingerprint(font_path, font_name, optimize=None, shared_subset=False, subset=SUBSET_POLICY):
+    """
+    Describes everything besides the source content that affects the rendered PDFs.
+    A change in any of these invalidates the whole manifest.
+    """
+    font_stat = os.stat(font_path)
+    return {
+        'layout_version': LAYOUT_VERSION,
+        'font_path': os.path.abspath(font_path),
+        'font_size': font_stat.st_size,
+        'font_mtime_ns': font_stat.st_mtime_ns,
+        'font_name': font_name,
+        'max_file_size': MAX_FILE_SIZE,
+        'max_stream_file_size': MAX_STREAM_FILE_SIZE,
+        'optimize': optimize,
+        'shared_subset': shared_subset,
+        'subset': subset,
+    }
 
-class PDF(FPDF):
-    def __init__(self, font_path, font_name='CustomFont'):
-        super().__init__()
-        self.set_auto_page_break(auto=True, margin=15)
-        self.add_page()
+def load_manifest(output_folder, fingerprint):
+    """
+    Returns the file entries of the manifest in output_folder,
+    or an empty dict if there is none or it was built with different settings.
+    """
+    manifest_path = Path(output_folder) / MANIFEST_FILENAME
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.error(f"Ignoring unreadable manifest '{manifest_path}': {e}")
+        return {}
+    if manifest.get('fingerprint') != fingerprint:
+        logging.info("Font or settings changed since the last run; rebuilding all PDFs.")
+        return {}
+    return manifest.get('files', {})
 
-        # Add TrueType font with Unicode support
-        if not os.path.isfile(font_path):
-            logging.error(f"Font file '{font_path}' not found.")
-            print(f"Font file '{font_path}' not found. Please ensure the font path is correct.")
-            sys.exit(1)
+def save_manifest(output_folder, fingerprint, entries):
+    """
+    Atomically writes the manifest for the current run.
+    """
+    manifest_path = Path(output_folder) / MANIFEST_FILENAME
+    temp_path = manifest_path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'fingerprint': fingerprint, 'files': entries}, f, indent=1, sort_keys=True)
+    os.replace(temp_path, manifest_path)
 
-        self.add_font(font_name, '', font_path, uni=True)
-        self.set_font(font_name, size=10)
+def plan_incremental_build(all_files, base_folder, pdf_folder, previous_entries, file_stats=None):
+    """
+    Compares the sources against the previous manifest entries.
+    file_stats maps file paths to stat results already gathered by scan_tree.
 
-    def add_text(self, text):
-        """
-        Adds multi-line text to the PDF.
-        """
-        # Split text into lines to handle wrapping
-        for line in text.split('\n'):
-            self.multi_cell(0, 5, line)
-            self.ln()
+    Returns (files to render, entries of unchanged files, entries of removed files).
+    A file is unchanged when its size and mtime match, or when only its mtime changed
+    and its content hash still matches; it is re-rendered if its PDF has gone missing.
+    """
+    to_render = []
+    unchanged = {}
+    for file_path in all_files:
+        relative_path = os.path.relpath(file_path, base_folder)
+        entry = previous_entries.get(relative_path)
+        if entry is not None:
+            st = file_stats[file_path] if file_stats else os.stat(file_path)
+            same = entry['size'] == st.st_size and (
+                entry['mtime_ns'] == st.st_mtime_ns or entry['sha256'] == file_digest(file_path)
+            )
+            if same and (entry['pdf'] is None or (Path(pdf_folder) / entry['pdf']).exists()):
+                unchanged[relative_path] = dict(entry, mtime_ns=st.st_mtime_ns)
+                continue
+        to_render.append(file_path)
 
-def is_binary(file_path):
+    current = {os.path.relpath(file_path, base_folder) for file_path in all_files}
+    removed = {path: entry for path, entry in previous_entries.items() if path not in current}
+    return to_render, unchanged, removed
+
+def manifest_entry(file_path, base_folder, pdf_folder, st=None):
     """
-    Check if a file is binary by looking for null bytes.
+    Builds the manifest entry for a freshly rendered file.
+    'pdf' is None when the file gets no PDF (binary or oversized files). Files that failed
+    get no entry, so the next run renders them again.
     """
-    try:
-        with open(file_path, 'rb') as f:
-            chunk = f.read(1024)
-            if b'\0' in chunk:
-                return True
-    except:
-        pass
-    return False
+    st = st or os.stat(file_path)
+    pdf_path = individual_pdf_path(file_path, base_folder, pdf_folder)
+    return {
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'sha256': file_digest(file_path),
+        'pdf': os.path.relpath(pdf_path, pdf_folder) if pdf_path.exists() else None,
+    }
 
-def process_file(file_path, base_folder, output_folder, font_path, font_name='CustomFont'):
+class _RecordCollector(logging.Handler):
     """
-    Processes a single file: reads its content and creates a PDF.
+    Buffers log records in a worker process so the parent can replay them.
     """
-    relative_path = os.path.relpath(file_path, base_folder)
-    display_path = relative_path.replace(os.sep, ' > ')
-    pdf = PDF(font_path, font_name)
+    def __init__(self):
+        super().__init__()
+        self.records = []
 
-    # Add the file location as the first line
-    pdf.add_text(f"File Location: {base_folder} > {display_path}\n\n")
+    def emit(self, record):
+        self.records.append((record.name, record.levelno, record.getMessage()))
 
-    # Determine if the file is binary
-    if is_binary(file_path):
-        pdf.add_text("**Binary File: Content not displayed**")
-        logging.info(f"Skipped binary file: {file_path}")
-        return
-    # Determine if the file exceeds the maximum size
-    if os.path.getsize(file_path) > MAX_FILE_SIZE:
-        pdf.add_text(f"**File skipped: Exceeds maximum size of {MAX_FILE_SIZE / (1024 * 1024)} MB**")
-        logging.info(f"Skipped large file: {file_path}")
-        return
+_WORKER_LOG_COLLECTOR = _RecordCollector()
+
+def _init_worker(font_path, profile=False, log_levels=None, disk_cache=None, shared_subset=None,
+                 subset_policy=SUBSET_POLICY):
+    """
+    Process pool initializer: drops the profiling data and --optimize size totals inherited
+    from the parent, routes logging to the collector with the parent's log levels, uses
+    the parent's persistent layout cache, shared font subset and subset policy, and parses
+    the font once.
+    """
+    PROFILER.enabled = profile
+    PROFILER.drain()
+    SIZE_REPORT.drain()
+    LAYOUT_CACHE.disk = disk_cache
+    FONT_REGISTRY.shared_subset = shared_subset
+    FONT_REGISTRY.subset_policy = subset_policy
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(_WORKER_LOG_COLLECTOR)
+    set_log_levels(log_levels or {})
+    # Errors are reported through the log records; the parent owns the console
+    sys.stdout = open(os.devnull, 'w')
+    if font_path:
+        FONT_REGISTRY.load(font_path)
 
+def _process_file_task(task):
+    """
+    Runs process_file in a worker and returns (file_path, pages as returned by process_file,
+    log records, error message, profiling data or None, --optimize size totals).
+    """
+    file_path = task[0]
+    pages = error = None
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        pdf.add_text(content)
-    except UnicodeDecodeError:
-        # If UTF-8 fails, try with 'utf-8' with replacement characters
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-            content = f.read()
-        pdf.add_text(content)
+        pages = process_file(*task)
     except Exception as e:
-        pdf.add_text(f"**Error reading file: {e}**")
-        logging.error(f"Error reading file {file_path}: {e}")
+        error = f"Failed to process {file_path}: {e}"
+    records = _WORKER_LOG_COLLECTOR.records
+    _WORKER_LOG_COLLECTOR.records = []
+    return file_path, pages, records, error, PROFILER.drain() if PROFILER.enabled else None, SIZE_REPORT.drain()
 
-    # Define the output PDF path
-    relative_pdf_path = Path(relative_path).with_suffix('.pdf')
-    output_pdf_path = Path(output_folder) / relative_pdf_path
+def process_files_parallel(all_files, base_folder, output_folder, font_path, font_name, creation_date, jobs,
+                           optimize=None):
+    """
+    Spreads process_file over a pool of worker processes.
+    Results come back in input order, so the log matches a serial run.
+    Returns the set of files that failed.
+    """
+    tasks = [(file_path, base_folder, output_folder, font_path, font_name, creation_date, optimize)
+             for file_path in all_files]
+    chunksize = max(1, len(tasks) // (jobs * 8))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(font_path, PROFILER.enabled, dict(_ACTIVE_LOG_LEVELS), LAYOUT_CACHE.disk,
+                                       FONT_REGISTRY.shared_subset, FONT_REGISTRY.subset_policy)) as executor:
+        results = executor.map(_process_file_task, tasks, chunksize=chunksize)
+        failed = set()
+        for file_path, pages, records, error, profile, sizes in tqdm(results, total=len(tasks), desc="Processing files"):
+            if pages is None:
+                failed.add(file_path)
+            if profile:
+                PROFILER.merge(profile)
+            SIZE_REPORT.merge(sizes)
+            for name, level, message in records:
+                logging.getLogger(name).log(level, message)
+                if level >= logging.ERROR:
+                    tqdm.write(message)
+            if error:
+                logging.error(error)
+                tqdm.write(error)
+    return failed
 
-    # Ensure the output directory exists
-    output_pdf_path.parent.mkdir(parents=True, exist_ok=True)
+@profiled('generate_merged_pdf')
+def generate_merged_pdf(all_files, base_folder, output_pdf_path, font_path, font_name='CustomFont', creation_date=None,
+                        optimize=None):
+    """
+    Renders every file straight into one shared document, each starting on a new page.
+    This produces the merged PDF in a single pass, without intermediate PDFs
+    (PyPDF2 is only needed to rewrite it for --optimize). Files above MAX_FILE_SIZE are
+    included like with --merge, laid out from their memory map by render_file.
+    """
+    pdf = PDF(font_path, font_name, creation_date)
+    for file_path in tqdm(all_files, desc="Rendering merged PDF"):
+        with SourceFile(file_path) as source:
+            render_file(pdf, source, base_folder)
 
-    # Save the PDF
     try:
-        pdf.output(str(output_pdf_path))
-        logging.info(f"Successfully created PDF for {file_path}")
+        write_pdf(pdf, output_pdf_path, optimize, kind='merged PDF')
+        logging.info(f"Merged PDF saved to '{output_pdf_path}'.")
+        print(f"Merged PDF saved to '{output_pdf_path}'.")
     except Exception as e:
-        logging.error(f"Failed to write PDF for {file_path}: {e}")
-        print(f"Failed to write PDF for {file_path}: {e}")
+        logging.error(f"Failed to write merged PDF: {e}")
+        print(f"Failed to write merged PDF: {e}")
 
-def generate_folder_structure_pdf(input_folder, output_folder, font_path, font_name='CustomFont'):
+@profiled('generate_folder_structure_pdf')
+def generate_folder_structure_pdf(input_folder, output_folder, font_path, font_name='CustomFont', tree=None, optimize=None):
     """
     Generates a PDF that outlines the folder structure of the input_folder.
+    tree is the index from scan_tree; the folder is scanned if it is not given.
     """
+    if tree is None:
+        tree = scan_tree(input_folder)
     structure_pdf = PDF(font_path, font_name)
 
     # Add title
-    structure_pdf.set_font(font_name, 'B', size=14)
+    structure_pdf.set_font(font_name, size=14)
     structure_pdf.add_text("Application Folder Structure\n\n")
     structure_pdf.set_font(font_name, size=10)
 
-    def add_directory_contents(pdf, directory, prefix=''):
+    def add_directory_contents(lines, node, prefix=''):
         """
-        Recursively adds directory contents to the PDF.
+        Recursively adds directory contents to lines.
         """
-        try:
-            items = sorted(os.listdir(directory))
-        except PermissionError:
-            pdf.add_text(f"{prefix}└── [Permission Denied]\n")
+        if node.error:
+            lines.append(f"{prefix}└── [Permission Denied]\n")
             return
 
-        for index, item in enumerate(items):
-            item_path = os.path.join(directory, item)
-            is_last = index == len(items) - 1
+        for index, child in enumerate(node.children):
+            is_last = index == len(node.children) - 1
             connector = "└── " if is_last else "├── "
-            pdf.add_text(f"{prefix}{connector}{item}")
-            if os.path.isdir(item_path):
+            lines.append(f"{prefix}{connector}{child.name}")
+            if child.is_dir:
                 extension = "    " if is_last else "│   "
-                add_directory_contents(pdf, item_path, prefix + extension)
+                add_directory_contents(lines, child, prefix + extension)
 
-    add_directory_contents(structure_pdf, input_folder)
+    lines = []
+    add_directory_contents(lines, tree)
+    structure_pdf.add_text("\n".join(lines))
 
     # Define the output PDF path
     output_pdf_path = Path(output_folder) / "application_folder_structure.pdf"
 
     # Save the PDF
     try:
-        structure_pdf.output(str(output_pdf_path))
+        write_pdf(structure_pdf, output_pdf_path, optimize, kind='folder structure PDF')
         logging.info(f"Successfully created folder structure PDF at {output_pdf_path}")
         print(f"Folder structure PDF saved to '{output_pdf_path}'.")
     except Exception as e:
         logging.error(f"Failed to write folder structure PDF: {e}")
         print(f"Failed to write folder structure PDF: {e}")
 
-def merge_pdfs(pdf_folder, output_filename):
+BFCHAR_PATTERN = re.compile(rb'<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>')
+
+def _font_codepoints(font):
+    """
+    Returns the codepoints used with an fpdf2 Type0 font, read from its ToUnicode CMap,
+    or None if its character IDs are not identity-mapped and it cannot be shared.
+    """
+    to_unicode = font.get('/ToUnicode')
+    if to_unicode is None:
+        return None
+    data = to_unicode.get_object().get_data()
+    if b'beginbfchar' not in data:
+        return None
+    codepoints = set()
+    for section in data.split(b'beginbfchar')[1:]:
+        for char_id, unicode in BFCHAR_PATTERN.findall(section.split(b'endbfchar')[0]):
+            if int(char_id, 16) != int(unicode, 16):
+                return None
+            codepoints.add(int(char_id, 16))
+    return codepoints
+
+def _share_fonts(reader, base_font, shared_font_ref, used_codepoints):
+    """
+    Points every page of reader that uses base_font at the shared font object instead.
+    Collects the codepoints those pages use into used_codepoints.
+    Returns the number of font objects replaced.
+    """
+    replaced = {}
+    for page in reader.pages:
+        resources = page.get('/Resources')
+        fonts = resources.get_object().get('/Font') if resources is not None else None
+        if fonts is None:
+            continue
+        fonts = fonts.get_object()
+        for name, ref in list(fonts.items()):
+            if ref is shared_font_ref:
+                continue
+            key = getattr(ref, 'idnum', id(ref))
+            if key not in replaced:
+                font = ref.get_object()
+                codepoints = None
+                if font.get('/Subtype') == '/Type0' and font.get('/BaseFont') == base_font:
+                    codepoints = _font_codepoints(font)
+                replaced[key] = codepoints is not None
+                if codepoints is not None:
+                    used_codepoints.update(codepoints)
+            if replaced[key]:
+                fonts[NameObject(name)] = shared_font_ref
+    return sum(replaced.values())
+
+def _extract_font_dict(pdf):
+    """
+    Outputs pdf and returns the font dictionary fpdf2 built for its font subset.
+    """
+    reader = PdfReader(BytesIO(pdf.output()))
+    return next(iter(reader.pages[0]['/Resources']['/Font'].values())).get_object()
+
+def _build_shared_font(font_path, font_name, codepoints):
+    """
+    Builds one fpdf2 Type0 font subset to the union of codepoints and returns its font dictionary.
+    """
+    pdf = PDF(font_path, font_name)
+    for codepoint in sorted(codepoints):
+        pdf.current_font.subset.pick(codepoint)
+    return _extract_font_dict(pdf)
+
+class PdfObjectWriter:
+    """
+    Minimal PDF object serializer that writes each object to the output as soon as it is
+    added, keeping only the xref offsets in memory.
+
+    Objects copied from PyPDF2 readers are renumbered on the fly, and individual PDFs
+    prepared by ParsedPdf only get their object numbers filled in. References created by
+    this writer (IndirectObject with pdf=None) are written as they are.
+
+    With optimize set to a deflate level (--optimize), streams are deflated at that level,
+    other objects are packed OBJECT_STREAM_SIZE at a time into object streams, and the
+    cross-reference table becomes a cross-reference stream (PDF 1.5). plain_size then
+    tracks what the same objects would have taken without it.
+    """
+
+    def __init__(self, stream, next_id=1, base_offset=0, optimize=None):
+        self.stream = stream
+        self.next_id = next_id
+        self.base_offset = base_offset
+        self.optimize = optimize
+        self.offsets = {}  # Object number -> file offset, or (object stream number, index)
+        self.plain_size = 0
+        self._packed = []
+        self._copied = {}
+        self._pending = []
+
+    def write_header(self):
+        """
+        Writes the PDF header; object streams need version 1.5.
+        """
+        version = b"1.3" if self.optimize is None else b"1.5"
+        self.stream.write(b"%PDF-" + version + b"\n%\xe2\xe3\xcf\xd3\n")
+
+    def allocate(self):
+        """
+        Reserves the next object number and returns a reference to it.
+        """
+        ref = IndirectObject(self.next_id, 0, None)
+        self.next_id += 1
+        return ref
+
+    def write(self, ref, obj):
+        """
+        Serializes obj as object ref.idnum at the current position.
+        """
+        if self.optimize is None:
+            self.offsets[ref.idnum] = self.base_offset + self.stream.tell()
+            self.stream.write(f"{ref.idnum} 0 obj\n".encode('latin-1'))
+            obj.write_to_stream(self.stream, None)
+            self.stream.write(b"\nendobj\n")
+            return
+        is_stream = isinstance(obj, StreamObject)
+        deflated = 0
+        if is_stream:
+            deflated = len(obj._data)
+            obj = deflate_stream(obj, self.optimize)
+            deflated -= len(obj._data)
+        body = BytesIO()
+        obj.write_to_stream(body, None)
+        self._write_body(ref.idnum, body.getvalue(), is_stream, deflated)
+
+    def _write_body(self, idnum, body, is_stream, deflated=0):
+        """
+        Writes a serialized object, or with optimize set, queues it for the next object
+        stream unless it is a stream itself. deflated is the number of bytes deflate_stream
+        saved on it, which counts towards plain_size.
+        """
+        self.plain_size += len(body) + deflated + len(f"{idnum} 0 obj\n\nendobj\n") + 20
+        if self.optimize is None or is_stream:
+            self._write_object(idnum, body)
+            return
+        self._packed.append((idnum, body))
+        if len(self._packed) >= OBJECT_STREAM_SIZE:
+            self._write_object_stream()
+
+    def _write_object(self, idnum, body):
+        self.offsets[idnum] = self.base_offset + self.stream.tell()
+        self.stream.write(b"%d 0 obj\n%s\nendobj\n" % (idnum, body))
+
+    def _write_object_stream(self):
+        """
+        Writes the queued objects as one deflated object stream.
+        """
+        if not self._packed:
+            return
+        ref = self.allocate()
+        header = []
+        offset = 0
+        for index, (idnum, body) in enumerate(self._packed):
+            header.append(b"%d %d" % (idnum, offset))
+            offset += len(body) + 1
+            self.offsets[idnum] = (ref.idnum, index)
+        header = b" ".join(header) + b"\n"
+        stream = StreamObject()
+        stream[NameObject('/Type')] = NameObject('/ObjStm')
+        stream[NameObject('/N')] = NumberObject(len(self._packed))
+        stream[NameObject('/First')] = NumberObject(len(header))
+        stream[NameObject('/Filter')] = NameObject('/FlateDecode')
+        stream._data = zlib.compress(header + b"\n".join(body for _, body in self._packed) + b"\n", self.optimize)
+        self._packed = []
+        body = BytesIO()
+        stream.write_to_stream(body, None)
+        self._write_object(ref.idnum, body.getvalue())
+
+    def copy(self, obj):
+        """
+        Returns obj with every reference into a source PDF replaced by a reference to a copy
+        in this file. The referenced objects are queued and written by flush().
+        """
+        if isinstance(obj, IndirectObject):
+            if obj.pdf is None:
+                return obj
+            key = (id(obj.pdf), obj.idnum, obj.generation)
+            ref = self._copied.get(key)
+            if ref is None:
+                ref = self.allocate()
+                self._copied[key] = ref
+                self._pending.append((ref, obj))
+            return ref
+        if isinstance(obj, StreamObject):
+            stream = StreamObject()
+            stream._data = obj._data
+            for key, value in obj.items():
+                if key != '/Length':
+                    stream[NameObject(key)] = self.copy(value)
+            return stream
+        if isinstance(obj, DictionaryObject):
+            return DictionaryObject({NameObject(key): self.copy(value) for key, value in obj.items()})
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.copy(value) for value in obj)
+        return obj
+
+    def write_parsed(self, parsed, shared_contents):
+        """
+        Writes the objects of a ParsedPdf with the next free object numbers and returns the
+        object numbers of its pages.
+
+        A page whose content stream has the digest of one already in shared_contents (digest
+        -> reference) is pointed at that stream instead, and its own copy is not written.
+        New content streams are added to shared_contents.
+        """
+        # Local numbers of duplicate content streams -> the object or local number used instead
+        aliases = {}
+        local_contents = {}
+        for number, digest in zip(parsed.contents, parsed.digests):
+            if number is None:
+                continue
+            if digest in shared_contents:
+                aliases[number] = shared_contents[digest]
+            elif digest in local_contents and local_contents[digest] != number:
+                aliases[number] = local_contents[digest]
+            else:
+                local_contents.setdefault(digest, number)
+
+        numbers = [None] * len(parsed.objects)
+        for number in range(len(parsed.objects)):
+            if number not in aliases:
+                numbers[number] = self.allocate().idnum
+        for number, target in aliases.items():
+            numbers[number] = target.idnum if isinstance(target, IndirectObject) else numbers[target]
+
+        for number in parsed.order:
+            if number in aliases:
+                continue
+            fragments, slots, is_stream = parsed.objects[number]
+            parts = []
+            for fragment, slot in zip(fragments, slots):
+                parts.append(fragment)
+                parts.append(b"%d 0 R" % numbers[slot])
+            parts.append(fragments[-1])
+            self._write_body(numbers[number], b"".join(parts), is_stream)
+        self.plain_size += parsed.deflated
+
+        for digest, number in local_contents.items():
+            shared_contents[digest] = IndirectObject(numbers[number], 0, None)
+        return [numbers[number] for number in parsed.pages]
+
+    def flush(self):
+        """
+        Writes every queued copy.
+        """
+        while self._pending:
+            ref, source = self._pending.pop()
+            self.write(ref, self.copy(source.get_object()))
+
+    def forget_sources(self):
+        """
+        Drops the source-to-copy mapping once a source PDF is done, since the object ids
+        used as keys may be reused by later readers.
+        """
+        self.flush()
+        self._copied = {}
+
+    def write_xref(self, trailer):
+        """
+        Writes the cross-reference table for every object written so far, then the trailer.
+        A fresh file (base offset 0) also gets the head of the free list, object 0.
+        """
+        if self.optimize is not None:
+            self._write_xref_stream(trailer)
+            return
+        xref_offset = self.base_offset + self.stream.tell()
+        offsets = dict(self.offsets)
+        self.stream.write(b"xref\n")
+        if self.base_offset == 0:
+            offsets[0] = None
+        ids = sorted(offsets)
+        start = 0
+        while start < len(ids):
+            end = start
+            while end + 1 < len(ids) and ids[end + 1] == ids[end] + 1:
+                end += 1
+            self.stream.write(f"{ids[start]} {end - start + 1}\n".encode('latin-1'))
+            for idnum in ids[start:end + 1]:
+                if offsets[idnum] is None:
+                    self.stream.write(b"0000000000 65535 f \n")
+                else:
+                    self.stream.write(f"{offsets[idnum]:010d} 00000 n \n".encode('latin-1'))
+            start = end + 1
+        trailer[NameObject('/Size')] = NumberObject(self.next_id)
+        self.stream.write(b"trailer\n")
+        trailer.write_to_stream(self.stream, None)
+        self.stream.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode('latin-1'))
+
+    def _write_xref_stream(self, trailer):
+        """
+        Writes the last object stream, then a cross-reference stream carrying the trailer entries.
+        """
+        self._write_object_stream()
+        ref = self.allocate()
+        xref_offset = self.base_offset + self.stream.tell()
+        offsets = dict(self.offsets)
+        offsets[ref.idnum] = xref_offset
+        if self.base_offset == 0:
+            offsets[0] = None
+        ids = sorted(offsets)
+        largest = max(max(entry) if isinstance(entry, tuple) else entry or 0 for entry in offsets.values())
+        width = max(1, (largest.bit_length() + 7) // 8)
+        index = ArrayObject()
+        rows = []
+        start = 0
+        while start < len(ids):
+            end = start
+            while end + 1 < len(ids) and ids[end + 1] == ids[end] + 1:
+                end += 1
+            index.extend([NumberObject(ids[start]), NumberObject(end - start + 1)])
+            start = end + 1
+        for idnum in ids:
+            entry = offsets[idnum]
+            if entry is None:
+                rows.append(b"\x00" + bytes(width) + b"\xff\xff")
+            elif isinstance(entry, tuple):
+                rows.append(b"\x02" + entry[0].to_bytes(width, 'big') + entry[1].to_bytes(2, 'big'))
+            else:
+                rows.append(b"\x01" + entry.to_bytes(width, 'big') + b"\x00\x00")
+
+        stream = StreamObject()
+        for key, value in trailer.items():
+            stream[NameObject(key)] = value
+        stream[NameObject('/Type')] = NameObject('/XRef')
+        stream[NameObject('/Size')] = NumberObject(self.next_id)
+        stream[NameObject('/Index')] = index
+        stream[NameObject('/W')] = ArrayObject([NumberObject(1), NumberObject(width), NumberObject(2)])
+        stream[NameObject('/Filter')] = NameObject('/FlateDecode')
+        stream._data = zlib.compress(b"".join(rows), self.optimize)
+        body = BytesIO()
+        stream.write_to_stream(body, None)
+        self._write_object(ref.idnum, body.getvalue())
+        self.stream.write(f"startxref\n{xref_offset}\n%%EOF\n".encode('latin-1'))
+
+def deflate_stream(stream, level):
+    """
+    Returns stream with its data deflated at level. Unfiltered data is compressed and
+    /FlateDecode data without decode parameters is recompressed; the result is kept only
+    if it is smaller. Streams with other filters are returned as they are.
+    """
+    filters = stream.get('/Filter')
+    if filters is None:
+        data = stream._data
+    elif filters in ('/FlateDecode', ['/FlateDecode']) and '/DecodeParms' not in stream:
+        data = zlib.decompress(stream._data)
+    else:
+        return stream
+    deflated = zlib.compress(data, level)
+    if len(deflated) >= len(stream._data):
+        return stream
+    result = StreamObject()
+    for key, value in stream.items():
+        if key not in ('/Length', '/Filter'):
+            result[NameObject(key)] = value
+    result[NameObject('/Filter')] = NameObject('/FlateDecode')
+    result._data = deflated
+    return result
+
+def optimize_pdf(data, level):
+    """
+    Rewrites a PDF written by fpdf2 with PdfObjectWriter's --optimize output: streams
+    deflated at level, other objects in object streams, and a cross-reference stream.
+    """
+    import_pypdf2()
+    reader = PdfReader(BytesIO(data))
+    output = BytesIO()
+    writer = PdfObjectWriter(output, optimize=level)
+    writer.write_header()
+    trailer = DictionaryObject()
+    for key in ('/Root', '/Info', '/ID'):
+        if key in reader.trailer:
+            trailer[NameObject(key)] = writer.copy(reader.trailer.raw_get(key))
+    writer.forget_sources()
+    writer.write_xref(trailer)
+    return output.getvalue()
+
+def write_pdf(pdf, output_pdf_path, optimize=None, kind='individual PDFs'):
+    """
+    Writes an fpdf2 document to output_pdf_path, rewritten by optimize_pdf when optimize
+    (a deflate level) is set. The size reduction is added to SIZE_REPORT under kind.
+    """
+    if optimize is None:
+        pdf.output(str(output_pdf_path))
+        return
+    data = pdf.output()
+    with PROFILER.phase('optimize'):
+        optimized = optimize_pdf(data, optimize)
+    with open(output_pdf_path, 'wb') as f:
+        f.write(optimized)
+    SIZE_REPORT.add(kind, len(data), len(optimized))
+
+def _content_digest(page):
+    """
+    Returns a digest of the page's content stream (filters and encoded bytes), or None
+    if the page does not have exactly one content stream.
+    """
+    contents = page.raw_get('/Contents') if '/Contents' in page else None
+    if not isinstance(contents, IndirectObject):
+        return None
+    stream = contents.get_object()
+    if not isinstance(stream, StreamObject):
+        return None
+    digest = hashlib.sha256(repr(stream.get('/Filter')).encode('latin-1'))
+    digest.update(stream._data)
+    return digest.hexdigest()
+
+class ParsedPdf:
+    """
+    An individual PDF read and serialized for merging, so the work can be done in a worker
+    process and pickled back to the process writing the merged PDF.
+
+    Every object the pages reference is numbered locally, in the order PdfObjectWriter.copy
+    would allocate it, and serialized to byte fragments with a gap for each reference to
+    another local object. References to objects of the merged PDF itself (the page tree
+    and the shared font) are written out as they are. write_parsed() then only fills in the
+    final object numbers. Fonts have already been pointed at the shared font (see
+    _share_fonts) and the content digests computed. With optimize set, streams are
+    deflated here too (see deflate_stream).
+    """
+
+    def __init__(self, pdf_path, pages_ref, base_font=None, shared_font_ref=None, optimize=None):
+        reader = PdfReader(pdf_path)
+        self.codepoints = set()
+        self.replaced_fonts = 0
+        if base_font:
+            self.replaced_fonts = _share_fonts(reader, base_font, shared_font_ref, self.codepoints)
+        self.objects = []  # (fragments, local numbers of the references between them, is stream) by local number
+        self.order = []  # Local numbers in the order the objects are written
+        self.pages = []
+        self.contents = []  # Local number of each page's content stream, if it has a digest
+        self.digests = []
+        self.optimize = optimize
+        self.deflated = 0  # Bytes saved by deflating streams, for PdfObjectWriter.plain_size
+        self._local = {}
+        self._pending = []
+        for page in reader.pages:
+            digest = _content_digest(page)
+            number = self._allocate(page.indirect_reference)
+            new_page = DictionaryObject({
+                NameObject(key): self._copy(value) for key, value in page.items() if key != '/Parent'
+            })
+            new_page[NameObject('/Parent')] = pages_ref
+            self._serialize(number, new_page)
+            while self._pending:
+                pending_number, source = self._pending.pop()
+                self._serialize(pending_number, self._copy(source.get_object()))
+            self.pages.append(number)
+            self.digests.append(digest)
+            contents = page.raw_get('/Contents') if digest is not None else None
+            self.contents.append(self._local[(contents.idnum, contents.generation)] if contents is not None else None)
+        del self._local, self._pending
+
+    def _allocate(self, source_ref=None):
+        number = len(self.objects)
+        self.objects.append(None)
+        if source_ref is not None:
+            self._local[(source_ref.idnum, source_ref.generation)] = number
+        return number
+
+    def _copy(self, obj):
+        """
+        Returns obj with every reference into the reader replaced by a local reference
+        (an IndirectObject whose pdf is self), queueing the objects not numbered yet.
+        """
+        # PyPDF2's object classes are typing Protocols, which makes isinstance() against them
+        # slow, so containers are recognized by their builtin base classes first
+        if isinstance(obj, dict):
+            if isinstance(obj, StreamObject):
+                stream = StreamObject()
+                stream._data = obj._data
+                for key, value in obj.items():
+                    if key != '/Length':
+                        stream[NameObject(key)] = self._copy(value)
+                if self.optimize is not None:
+                    stream = deflate_stream(stream, self.optimize)
+                    self.deflated += len(obj._data) - len(stream._data)
+                return stream
+            return DictionaryObject({NameObject(key): self._copy(value) for key, value in obj.items()})
+        if isinstance(obj, list):
+            return ArrayObject(self._copy(value) for value in obj)
+        if obj.__class__ is IndirectObject:
+            if obj.pdf is None:
+                return obj
+            number = self._local.get((obj.idnum, obj.generation))
+            if number is None:
+                number = self._allocate(obj)
+                self._pending.append((number, obj))
+            return IndirectObject(number, 0, self)
+        return obj if obj is not None else NullObject()
+
+    def _serialize(self, number, obj):
+        """
+        Serializes obj like write_to_stream() does, splitting the bytes at local references.
+        obj comes from _copy(), so its containers are exactly the base PyPDF2 classes.
+        """
+        fragments = []
+        slots = []
+        buffer = BytesIO()
+
+        def write(obj):
+            cls = obj.__class__
+            if cls is IndirectObject and obj.pdf is self:
+                fragments.append(buffer.getvalue())
+                slots.append(obj.idnum)
+                buffer.seek(0)
+                buffer.truncate()
+            elif cls is StreamObject:
+                obj[NameObject('/Length')] = NumberObject(len(obj._data))
+                write_dictionary(obj)
+                buffer.write(b"\nstream\n")
+                buffer.write(obj._data)
+                buffer.write(b"\nendstream")
+            elif cls is DictionaryObject:
+                write_dictionary(obj)
+            elif cls is ArrayObject:
+                buffer.write(b"[")
+                for value in obj:
+                    buffer.write(b" ")
+                    write(value)
+                buffer.write(b" ]")
+            else:
+                obj.write_to_stream(buffer, None)
+
+        def write_dictionary(obj):
+            buffer.write(b"<<\n")
+            for key, value in obj.items():
+                key.write_to_stream(buffer, None)
+                buffer.write(b" ")
+                write(value)
+                buffer.write(b"\n")
+            buffer.write(b">>")
+
+        write(obj)
+        fragments.append(buffer.getvalue())
+        self.objects[number] = (fragments, slots, obj.__class__ is StreamObject)
+        self.order.append(number)
+
+def _parse_pdf_task(task):
+    """
+    Reads one individual PDF in a merge worker and returns
+    (ParsedPdf or None, log records, error message).
+    """
+    import_pypdf2()
+    parsed = error = None
+    try:
+        parsed = ParsedPdf(*task)
+    except Exception as e:
+        error = str(e)
+    records = _WORKER_LOG_COLLECTOR.records
+    _WORKER_LOG_COLLECTOR.records = []
+    return parsed, records, error
+
+def parse_pdfs(pdf_paths, pages_ref, base_font, shared_font_ref, jobs=1, optimize=None):
+    """
+    Yields (pdf_path, ParsedPdf or None, error message) for each PDF, in the order given.
+    With jobs > 1 the PDFs are read by a pool of worker processes, at most MERGE_READ_AHEAD
+    per worker ahead of the caller, so memory stays bounded when writing is the slower side.
+    """
+    if jobs <= 1:
+        for pdf_path in pdf_paths:
+            try:
+                yield pdf_path, ParsedPdf(pdf_path, pages_ref, base_font, shared_font_ref, optimize), None
+            except Exception as e:
+                yield pdf_path, None, str(e)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(None, False, dict(_ACTIVE_LOG_LEVELS))) as executor:
+        def result(pdf_path, future):
+            parsed, records, error = future.result()
+            for name, level, message in records:
+                logging.getLogger(name).log(level, message)
+            return pdf_path, parsed, error
+
+        pending = deque()
+        for pdf_path in pdf_paths:
+            task = (pdf_path, pages_ref, base_font, shared_font_ref, optimize)
+            pending.append((pdf_path, executor.submit(_parse_pdf_task, task)))
+            if len(pending) >= jobs * MERGE_READ_AHEAD:
+                yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
+
+STARTXREF_PATTERN = re.compile(rb'startxref\s+(\d+)\s+%%EOF\s*$')
+
+def _merge_index_path(output_pdf_path):
+    """
+    Returns the path of the page-range index kept next to the merged PDF.
+    """
+    return Path(output_pdf_path).with_suffix('.index.json')
+
+def load_merge_index(output_pdf_path, base_font, optimize=None):
+    """
+    Returns the page-range index of the merged PDF, or None if it is missing, incomplete,
+    stale, built with another font or --optimize setting, or the PDF has had too many
+    incremental updates.
+    """
+    try:
+        with open(_merge_index_path(output_pdf_path), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        st = os.stat(output_pdf_path)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(index, dict):
+        return None
+    if index.get('output') != {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}:
+        logging.info("Merged PDF changed since it was indexed; rebuilding it.")
+        return None
+    # An index written by an older version or edited by hand may lack fields update_merged_pdf reads
+    try:
+        font = index['font']
+        updates = int(index['updates'])
+        complete = (
+            isinstance(index['contents'], dict)
+            and (not font or {'base_font', 'id', 'codepoints'} <= font.keys())
+            and all({'path', 'size', 'mtime_ns', 'pages'} <= doc.keys() for doc in index['documents'])
+        )
+    except (KeyError, TypeError, ValueError, AttributeError):
+        complete = False
+    if not complete:
+        logging.info("Merge index is incomplete; rebuilding the merged PDF.")
+        return None
+    if (font or {}).get('base_font') != base_font:
+        return None
+    if index.get('optimize') != optimize:
+        return None
+    if updates >= MAX_INCREMENTAL_UPDATES:
+        logging.info(f"Merged PDF has {updates} incremental updates; rebuilding it.")
+        return None
+    return index
+
+def save_merge_index(output_pdf_path, documents, font, updates, contents, optimize=None):
+    """
+    Records which page objects of the merged PDF belong to which individual PDF,
+    and the object number of each distinct content stream (by content digest).
+    """
+    st = os.stat(output_pdf_path)
+    index = {
+        'output': {'size': st.st_size, 'mtime_ns': st.st_mtime_ns},
+        'font': font,
+        'updates': updates,
+        'documents': documents,
+        'contents': contents,
+        'optimize': optimize,
+    }
+    with open(_merge_index_path(output_pdf_path), 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+
+def update_merged_pdf(output_pdf_path, all_pdfs, pdf_folder, index, font_path=None, font_name='CustomFont', jobs=1,
+                      optimize=None):
+    """
+    Brings the merged PDF up to date by appending a PDF incremental update.
+
+    Pages of unchanged individual PDFs are reused by object number from the page-range index.
+    Only changed or new PDFs are read (by `jobs` worker processes) and appended, followed by
+    a new page tree and, if new glyphs are needed, a new version of the shared font.
+    The cost scales with the change. The update is written with the same optimize setting
+    as the rest of the file (load_merge_index checks it).
+    """
+    import_pypdf2()
+    merged = PdfReader(output_pdf_path)
+    trailer = merged.trailer
+    pages_ref = IndirectObject(trailer['/Root'].raw_get('/Pages').idnum, 0, None)
+    with open(output_pdf_path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(output_pdf_path) - 1024))
+        prev_xref = int(STARTXREF_PATTERN.search(f.read()).group(1))
+
+    # PyPDF2 does not copy /Size from a cross-reference stream (--optimize) into the trailer
+    next_id = trailer.get('/Size') or 1 + max([*merged.xref_objStm, *(idnum for ids in merged.xref.values() for idnum in ids)])
+
+    buffer = BytesIO()
+    buffer.write(b"\n")
+    writer = PdfObjectWriter(buffer, next_id=next_id, base_offset=os.path.getsize(output_pdf_path), optimize=optimize)
+
+    font = index['font']
+    base_font = font_ref = None
+    if font:
+        base_font = font['base_font']
+        font_ref = IndirectObject(font['id'], 0, None)
+        used_codepoints = set(font['codepoints'])
+
+    shared_contents = {digest: IndirectObject(idnum, 0, None) for digest, idnum in index['contents'].items()}
+    previous = {doc['path']: doc for doc in index['documents']}
+    stale = []
+    for pdf_path in all_pdfs:
+        st = os.stat(pdf_path)
+        doc = previous.get(os.path.relpath(pdf_path, pdf_folder))
+        if doc is None or doc['size'] != st.st_size or doc['mtime_ns'] != st.st_mtime_ns:
+            stale.append(pdf_path)
+
+    updated = {}
+    for pdf_path, parsed, error in parse_pdfs(stale, pages_ref, base_font, font_ref, jobs, optimize):
+        if error is not None:
+            logging.error(f"Failed to read '{pdf_path}': {error}")
+            print(f"Failed to read '{pdf_path}': {error}")
+            continue
+        page_ids = writer.write_parsed(parsed, shared_contents)
+        if font:
+            used_codepoints |= parsed.codepoints
+        st = os.stat(pdf_path)
+        updated[pdf_path] = {'path': os.path.relpath(pdf_path, pdf_folder), 'size': st.st_size,
+                             'mtime_ns': st.st_mtime_ns, 'pages': page_ids}
+
+    documents = []
+    changed = []
+    for pdf_path in all_pdfs:
+        if pdf_path in updated:
+            documents.append(updated[pdf_path])
+            changed.append(updated[pdf_path]['path'])
+        elif pdf_path not in stale:
+            documents.append(previous[os.path.relpath(pdf_path, pdf_folder)])
+
+    if not changed and [doc['path'] for doc in documents] == [doc['path'] for doc in index['documents']]:
+        logging.info(f"Merged PDF '{output_pdf_path}' is up to date.")
+        print(f"Merged PDF '{output_pdf_path}' is up to date.")
+        return
+
+    if font and len(used_codepoints) > len(font['codepoints']):
+        writer.write(font_ref, writer.copy(_build_shared_font(font_path, font_name, used_codepoints)))
+        writer.forget_sources()
+        font = dict(font, codepoints=sorted(used_codepoints))
+
+    kids = [IndirectObject(page_id, 0, None) for doc in documents for page_id in doc['pages']]
+    writer.write(pages_ref, DictionaryObject({
+        NameObject('/Type'): NameObject('/Pages'),
+        NameObject('/Kids'): ArrayObject(kids),
+        NameObject('/Count'): NumberObject(len(kids)),
+    }))
+
+    new_trailer = DictionaryObject({NameObject('/Prev'): NumberObject(prev_xref)})
+    for key in ('/Root', '/Info', '/ID'):
+        if key in trailer:
+            new_trailer[NameObject(key)] = trailer.raw_get(key)
+    writer.write_xref(new_trailer)
+
+    with open(output_pdf_path, 'ab') as f_out:
+        f_out.write(buffer.getvalue())
+    save_merge_index(output_pdf_path, documents, font, index['updates'] + 1,
+                     {digest: ref.idnum for digest, ref in shared_contents.items()}, optimize)
+    if optimize is not None:
+        SIZE_REPORT.add('merged PDF updates', writer.plain_size, len(buffer.getvalue()))
+
+    removed = len(set(previous) - {doc['path'] for doc in documents})
+    logging.info(f"Updated merged PDF '{output_pdf_path}' in place: {len(changed)} changed, {removed} removed, "
+                 f"{len(buffer.getvalue())} bytes appended.")
+    print(f"Updated merged PDF '{output_pdf_path}' ({len(changed)} changed, {removed} removed).")
+
+@profiled('merge_pdfs')
+def merge_pdfs(pdf_folder, output_filename, font_path=None, font_name='CustomFont', incremental=False, jobs=1,
+               optimize=None):
     """
     Merges all PDFs in the specified folder into a single PDF.
     Each PDF starts on a new page.
+
+    The merged PDF is written as it is assembled: every page of an input PDF is copied to
+    the output together with the objects it references before the next input is copied, so
+    memory holds only the xref offsets, the page list and the content-stream digests,
+    whatever the number of pages. With jobs > 1 the inputs are parsed by worker processes
+    (see parse_pdfs) and copied here in sorted order.
+
+    When font_path is given, every page rendered with that font is pointed at one shared
+    font object, subset to the union of the glyphs used, instead of carrying one embedded
+    font program per source file.
+
+    A page-range index is saved next to the merged PDF. With incremental=True and a valid
+    index, only changed PDFs are appended to the existing file (see update_merged_pdf).
+    optimize is the deflate level of --optimize (see PdfObjectWriter).
     """
-    writer = PdfWriter()
+    import_pypdf2()
+    base_font = None
+    if font_path:
+        base_font = FONT_REGISTRY.base_font(font_path)
 
     # Collect all PDF files, excluding the merged PDF itself to prevent recursion
     all_pdfs = []
     for root, dirs, files in os.walk(pdf_folder):
+        dirs.sort()
         for file in sorted(files):
             if file.lower().endswith('.pdf') and file != output_filename:
                 all_pdfs.append(os.path.join(root, file))
@@ -199,34 +3355,121 @@ def merge_pdfs(pdf_folder, output_filename):
     logging.info(f"Found {len(all_pdfs)} PDFs to merge.")
     print(f"Found {len(all_pdfs)} PDFs to merge.")
 
-    for pdf_path in tqdm(all_pdfs, desc="Merging PDFs"):
-        try:
-            reader = PdfReader(pdf_path)
-            for page in reader.pages:
-                writer.add_page(page)
-        except Exception as e:
-            logging.error(f"Failed to read '{pdf_path}': {e}")
-            print(f"Failed to read '{pdf_path}': {e}")
-
     # Define the output PDF path
     output_pdf_path = Path(pdf_folder) / output_filename
 
-    # Save the merged PDF
+    if incremental:
+        index = load_merge_index(output_pdf_path, base_font, optimize)
+        if index is not None:
+            try:
+                update_merged_pdf(output_pdf_path, all_pdfs, pdf_folder, index, font_path, font_name, jobs, optimize)
+                return
+            except Exception as e:
+                logging.error(f"Incremental update of '{output_pdf_path}' failed, rebuilding it: {e}")
+
+    # Write next to the output and rename at the end, so a failed merge keeps the previous PDF
+    temp_path = output_pdf_path.with_name(output_pdf_path.name + '.tmp')
     try:
-        with open(output_pdf_path, 'wb') as f_out:
-            writer.write(f_out)
+        with open(temp_path, 'wb') as f_out:
+            writer = PdfObjectWriter(f_out, optimize=optimize)
+            writer.write_header()
+            pages_ref = writer.allocate()
+            if base_font:
+                shared_font_ref = writer.allocate()
+                used_codepoints = set()
+                replaced_fonts = 0
+            else:
+                shared_font_ref = None
+
+            documents = []
+            kids = ArrayObject()
+            # Identical pages (such as the pages of identical files after the first) share one content stream
+            shared_contents = {}
+            parsed_pdfs = parse_pdfs(all_pdfs, pages_ref, base_font, shared_font_ref, jobs, optimize)
+            for pdf_path, parsed, error in tqdm(parsed_pdfs, total=len(all_pdfs), desc="Merging PDFs"):
+                if error is not None:
+                    logging.error(f"Failed to read '{pdf_path}': {error}")
+                    print(f"Failed to read '{pdf_path}': {error}")
+                    continue
+                page_ids = writer.write_parsed(parsed, shared_contents)
+                if base_font:
+                    used_codepoints |= parsed.codepoints
+                    replaced_fonts += parsed.replaced_fonts
+                kids.extend(IndirectObject(page_id, 0, None) for page_id in page_ids)
+                st = os.stat(pdf_path)
+                documents.append({
+                    'path': os.path.relpath(pdf_path, pdf_folder),
+                    'size': st.st_size,
+                    'mtime_ns': st.st_mtime_ns,
+                    'pages': page_ids,
+                })
+
+            font = None
+            if base_font:
+                writer.write(shared_font_ref, writer.copy(_build_shared_font(font_path, font_name, used_codepoints)))
+                writer.forget_sources()
+                logging.info(f"Replaced {replaced_fonts} embedded fonts with one shared subset of {len(used_codepoints)} glyphs.")
+                font = {'base_font': base_font, 'id': shared_font_ref.idnum, 'codepoints': sorted(used_codepoints)}
+
+            writer.write(pages_ref, DictionaryObject({
+                NameObject('/Type'): NameObject('/Pages'),
+                NameObject('/Kids'): kids,
+                NameObject('/Count'): NumberObject(len(kids)),
+            }))
+            catalog_ref = writer.allocate()
+            writer.write(catalog_ref, DictionaryObject({
+                NameObject('/Type'): NameObject('/Catalog'),
+                NameObject('/Pages'): pages_ref,
+            }))
+            writer.write_xref(DictionaryObject({NameObject('/Root'): catalog_ref}))
+            if optimize is not None:
+                SIZE_REPORT.add('merged PDF', writer.plain_size, f_out.tell())
+        os.replace(temp_path, output_pdf_path)
+        save_merge_index(output_pdf_path, documents, font, 0,
+                         {digest: ref.idnum for digest, ref in shared_contents.items()}, optimize)
         logging.info(f"Merged PDF saved to '{output_pdf_path}'.")
         print(f"Merged PDF saved to '{output_pdf_path}'.")
     except Exception as e:
+        temp_path.unlink(missing_ok=True)
         logging.error(f"Failed to write merged PDF: {e}")
         print(f"Failed to write merged PDF: {e}")
 
-def main():
+def profile_slowest_files(count, base_folder, output_folder, font_path, font_name='CustomFont'):
+    """
+    Re-renders the `count` slowest files of the run under cProfile, writing the PDFs to a
+    scratch folder and one .prof file per source to output_folder/profiles.
+    The layout cache is bypassed so the profiles include the layout work.
+    Returns the list of .prof paths.
+    """
+    global LAYOUT_CACHE
+    profiles_folder = Path(output_folder) / "profiles"
+    profiles_folder.mkdir(parents=True, exist_ok=True)
+    prof_paths = []
+    enabled, PROFILER.enabled = PROFILER.enabled, False
+    layout_cache, LAYOUT_CACHE = LAYOUT_CACHE, LayoutCache(0)
+    try:
+        with tempfile.TemporaryDirectory() as scratch_folder:
+            for rank, record in enumerate(PROFILER.slowest_files(count), start=1):
+                file_path = record['path']
+                safe_name = re.sub(r'[^\w.-]+', '_', os.path.relpath(file_path, base_folder))
+                prof_path = profiles_folder / f"{rank:02d}_{safe_name}.prof"
+                profile = cProfile.Profile()
+                profile.runcall(process_file, file_path, base_folder, scratch_folder, font_path, font_name)
+                profile.dump_stats(str(prof_path))
+                prof_paths.append(prof_path)
+                logging.info(f"Wrote cProfile stats for {file_path} to '{prof_path}'.")
+    finally:
+        PROFILER.enabled = enabled
+        LAYOUT_CACHE = layout_cache
+    return prof_paths
+
+def main(args=None):
     """
     Main function to convert files in a folder to PDFs, generate folder structure, and merge PDFs.
 
-    This function parses command-line arguments to specify the input folder, output folder, font file,
-    and optional actions such as generating a folder structure PDF and merging individual PDFs into a
+    args are the command-line arguments from parse_arguments(), which parses sys.argv when
+    args is None. They specify the input folder, output folder, font file, and optional
+    actions such as generating a folder structure PDF and merging individual PDFs into a
     single PDF. It validates the input paths, creates necessary output directories, processes files
     in the input folder, and performs the requested actions.
 
@@ -237,25 +3480,56 @@ def main():
         --fontname (str): Name to assign to the custom font in the PDF (default: 'CustomFont').
         --generate-structure (bool): Generate a PDF outlining the folder structure (optional).
         --merge (bool): Merge all individual PDFs into a single app_source.pdf (optional).
+        --jobs (int): Number of worker processes for file conversion and merging (default: 1, 0 = all CPUs).
+        --single-pass (bool): Render app_source.pdf directly from the sources instead of merging
+            the individual PDFs with PyPDF2 (implies --merge).
+        --no-individual (bool): Do not write individual PDFs (requires --single-pass).
+        --force (bool): Re-render every file and rebuild app_source.pdf from scratch,
+            ignoring the incremental build manifest and merge index.
+        --profile (bool): Time each phase and file, and write profile_report.json and
+            profile_files.csv to the output folder.
+        --profile-slowest (int): With --profile, also write cProfile stats for the N slowest files.
+        --log-file (str): Log file to write (default: pdf_conversion.log).
+        --log-level (str): Level of the application's own log records (default: INFO).
+        --log-levels (str): Per-subsystem levels as comma-separated name=LEVEL pairs,
+            e.g. fontTools=INFO,PyPDF2=ERROR (fontTools, fpdf and PyPDF2 default to WARNING).
+        --log-format (str): 'text' or 'json' for one JSON object per line (default: text).
+        --cache-dir (str): Persistent layout cache shared between runs and output folders
+            (default: $CONVERT_TO_PDF_CACHE_DIR; no persistent cache if unset).
+        --cache-size (int): Size limit of the persistent layout cache in MB (default: 512).
+        --optimize (int): Deflate level 0-9. Recompresses every stream at that level and
+            packs the other objects into object streams with a cross-reference stream
+            (PDF 1.5), for the individual, structure and merged PDFs. The size reduction
+            is reported at the end.
+        --shared-subset (bool): Collect the characters of every file to render, subset the
+            font once and embed that subset in every PDF of the run instead of subsetting
+            the font for each document.
+        --discovery (str): How files are found: 'walk' scans the folder (default), 'gitignore'
+            scans it without descending into folders its .gitignore files ignore, and 'git'
+            lists the files tracked in the repository's .git/index without scanning the folder.
+        --subset (str): Font subsetting policy: 'always' subsets the font for each document
+            (default), 'never' embeds the whole font, 'auto' embeds fonts up to 1 MB whole
+            and subsets larger ones.
+        --filters (str): JSON file of include and exclude rules added to FILTERS: globs,
+            extensions, path regexes, file size limits and modification time limits
+            (see PathFilter).
 
     Raises:
         SystemExit: If the input folder does not exist or is not a directory.
         SystemExit: If the font file is not found.
+        SystemExit: If --no-individual is given without --single-pass.
+        SystemExit: If the filters cannot be read or are invalid.
 
     """
-    parser = argparse.ArgumentParser(description="Convert files in a folder to PDFs with file paths, generate folder structure, and merge PDFs.")
-    parser.add_argument("input_folder", help="Path to the input folder (e.g., app_folder)")
-    parser.add_argument("output_folder", help="Path to the output folder where PDFs will be saved")
-    parser.add_argument("--font", help="Path to the TTF font file to use for PDFs", required=True)
-    parser.add_argument("--fontname", help="Name to assign to the custom font in the PDF", default='CustomFont')
-    parser.add_argument("--generate-structure", action='store_true', help="Generate a PDF outlining the folder structure")
-    parser.add_argument("--merge", action='store_true', help="Merge all individual PDFs into a single app_source.pdf")
-    args = parser.parse_args()
+    if args is None:
+        args = parse_arguments()
+    configure_logging(args.log_file, args.log_level, args.log_format, args.log_levels)
 
     input_folder = args.input_folder
     output_folder = args.output_folder
     font_path = args.font
     font_name = args.fontname
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
 
     if not os.path.isdir(input_folder):
         print(f"Input folder '{input_folder}' does not exist or is not a directory.")
@@ -265,42 +3539,147 @@ def main():
         print(f"Font file '{font_path}' not found. Please provide a valid TTF font file.")
         sys.exit(1)
 
+    if args.no_individual and not args.single_pass:
+        print("--no-individual requires --single-pass, since the PyPDF2 merge reads the individual PDFs.")
+        sys.exit(1)
+
+    try:
+        path_filter = PathFilter.load(args.filters)
+    except (OSError, ValueError) as e:
+        print(f"Invalid discovery filters{f' in {args.filters!r}' if args.filters else ''}: {e}")
+        sys.exit(1)
+
+    run_start = time.perf_counter()
+    PROFILER.enabled = args.profile
+    FONT_REGISTRY.subset_policy = args.subset
+    if args.subset != 'always' and not ListingFontOutputProducer.supported():
+        print(f"The installed fpdf2 cannot embed whole fonts; --subset {args.subset} subsets the font like 'always'.")
+        logging.warning(f"The installed fpdf2 cannot embed whole fonts; --subset {args.subset} subsets the font like 'always'.")
+    if args.cache_dir:
+        LAYOUT_CACHE.disk = DiskLayoutCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
     # Create output directories
     individual_pdfs_folder = Path(output_folder) / "individual_pdfs"
     individual_pdfs_folder.mkdir(parents=True, exist_ok=True)
 
-    # Collect all files, excluding skipped folders
-    all_files = []
-    for root, dirs, files in os.walk(input_folder):
-        # Modify dirs in-place to skip certain folders
-        dirs[:] = [d for d in dirs if d not in SKIP_FOLDERS and not d.startswith('.')]
-        for file in files:
-            if file not in SKIP_FILES and not file.startswith('.'):
-                all_files.append(os.path.join(root, file))
+    # Index the input folder once; file discovery and the structure PDF both use it
+    tree = None
+    if args.discovery == 'git':
+        tree = scan_git_index(input_folder, path_filter)
+        if tree is None:
+            print(f"No readable git index for '{input_folder}'; scanning it with its .gitignore files instead.")
+            logging.info(f"No readable git index for '{input_folder}'; scanning it with its .gitignore files instead.")
+    if tree is None:
+        tree = scan_tree(input_folder, gitignore=args.discovery != 'walk', path_filter=path_filter)
+    file_stats = dict(tree_files(tree))
+    all_files = list(file_stats)
 
     print(f"Found {len(all_files)} files to process.")
     logging.info(f"Found {len(all_files)} files to process.")
 
+    # One timestamp for the whole run keeps serial and parallel output byte-identical
+    creation_date = datetime.now(timezone.utc)
+
+    # Only re-render files that changed since the last run, per the manifest
+    files_to_render = all_files
+    if not args.no_individual:
+        fingerprint = settings_fingerprint(font_path, font_name, args.optimize, args.shared_subset, args.subset)
+        previous_entries = {} if args.force else load_manifest(output_folder, fingerprint)
+        files_to_render, manifest_entries, removed = plan_incremental_build(
+            all_files, input_folder, individual_pdfs_folder, previous_entries, file_stats)
+        # Sources with the same name but another extension share an output path (foo.py and foo.js
+        # both make foo.pdf); the PDF of a removed one stays if a current file owns its path
+        owned = {entry['pdf'] for entry in manifest_entries.values() if entry['pdf']}
+        owned.update(os.path.relpath(individual_pdf_path(file_path, input_folder, individual_pdfs_folder),
+                                     individual_pdfs_folder) for file_path in files_to_render)
+        for relative_path, entry in removed.items():
+            if entry['pdf'] and entry['pdf'] not in owned and (individual_pdfs_folder / entry['pdf']).exists():
+                (individual_pdfs_folder / entry['pdf']).unlink()
+                logging.info(f"Deleted PDF for removed file: {relative_path}")
+        print(f"{len(files_to_render)} changed, {len(manifest_entries)} unchanged, {len(removed)} removed.")
+        logging.info(f"{len(files_to_render)} changed, {len(manifest_entries)} unchanged, {len(removed)} removed.")
+
+    # Fail before converting anything if the merge stage, --optimize or a streamed file needs PyPDF2
+    streams = not args.no_individual and any(_streamed_size(file_stats[file_path].st_size)
+                                             for file_path in files_to_render)
+    if (args.merge and not args.single_pass) or args.optimize is not None or streams:
+        try:
+            import_pypdf2()
+        except ImportError as e:
+            logging.error(str(e))
+            print(e)
+            sys.exit(1)
+
+    # One font subset for every PDF of the run, covering all the characters they use
+    if args.shared_subset and files_to_render and not args.no_individual and FONT_REGISTRY.subsets(font_path):
+        if not (FONT_REGISTRY.identity_ids(font_path) and ListingFontOutputProducer.supported()):
+            print("The installed fpdf2 cannot share a font subset between PDFs; subsetting the font for each PDF.")
+            logging.warning("The installed fpdf2 cannot share a font subset between PDFs; subsetting the font for each PDF.")
+        else:
+            codepoints = collect_codepoints(files_to_render, input_folder, tree if args.generate_structure else None)
+            FONT_REGISTRY.shared_subset = SharedSubset(font_path, font_name, codepoints)
+            print(f"Subset the font once for {len(FONT_REGISTRY.shared_subset.codepoints)} characters.")
+
     # Process files with a progress bar
-    for file_path in tqdm(all_files, desc="Processing files"):
-        process_file(file_path, input_folder, individual_pdfs_folder, font_path, font_name)
+    failed = set()
+    if args.no_individual:
+        logging.info("Skipping individual PDFs (--no-individual).")
+    elif jobs > 1:
+        failed = process_files_parallel(files_to_render, input_folder, individual_pdfs_folder, font_path, font_name,
+                                        creation_date, jobs, args.optimize)
+    else:
+        for file_path in tqdm(files_to_render, desc="Processing files"):
+            if process_file(file_path, input_folder, individual_pdfs_folder, font_path, font_name, creation_date,
+                            args.optimize) is None:
+                failed.add(file_path)
 
-    print(f"Individual PDFs have been saved to '{individual_pdfs_folder}'.")
-    logging.info(f"Individual PDFs have been saved to '{individual_pdfs_folder}'.")
+    if not args.no_individual:
+        for file_path in files_to_render:
+            # Failed files stay out of the manifest, so the next run retries them
+            if file_path in failed:
+                continue
+            manifest_entries[os.path.relpath(file_path, input_folder)] = manifest_entry(
+                file_path, input_folder, individual_pdfs_folder, file_stats[file_path])
+        save_manifest(output_folder, fingerprint, manifest_entries)
+        print(f"Individual PDFs have been saved to '{individual_pdfs_folder}'.")
+        logging.info(f"Individual PDFs have been saved to '{individual_pdfs_folder}'.")
 
     # Generate folder structure PDF if requested
     if args.generate_structure:
         print("Generating folder structure PDF...")
         logging.info("Generating folder structure PDF...")
-        generate_folder_structure_pdf(input_folder, output_folder, font_path, font_name)
+        generate_folder_structure_pdf(input_folder, output_folder, font_path, font_name, tree, args.optimize)
 
+    # Render app_source.pdf directly from the sources if requested
+    if args.single_pass:
+        print("Rendering 'app_source.pdf' in a single pass...")
+        logging.info("Rendering 'app_source.pdf' in a single pass...")
+        generate_merged_pdf(all_files, input_folder, individual_pdfs_folder / "app_source.pdf", font_path, font_name, creation_date,
+                            args.optimize)
+        print("Merged PDF 'app_source.pdf' has been created.")
+        logging.info("Merged PDF 'app_source.pdf' has been created.")
     # Merge PDFs into app_source.pdf if requested
-    if args.merge:
+    elif args.merge:
         print("Merging individual PDFs into 'app_source.pdf'...")
         logging.info("Merging individual PDFs into 'app_source.pdf'...")
-        merge_pdfs(individual_pdfs_folder, "app_source.pdf")
+        merge_pdfs(individual_pdfs_folder, "app_source.pdf", font_path, font_name, incremental=not args.force, jobs=jobs,
+                   optimize=args.optimize)
         print("Merged PDF 'app_source.pdf' has been created.")
         logging.info("Merged PDF 'app_source.pdf' has been created.")
 
+    if LAYOUT_CACHE.disk is not None:
+        LAYOUT_CACHE.disk.evict()
+
+    if args.optimize is not None:
+        SIZE_REPORT.report()
+
+    if args.profile:
+        report_path = PROFILER.write_report(output_folder, time.perf_counter() - run_start)
+        print(f"Profiling report saved to '{report_path}'.")
+        logging.info(f"Profiling report saved to '{report_path}'.")
+        if args.profile_slowest > 0:
+            prof_paths = profile_slowest_files(args.profile_slowest, input_folder, output_folder, font_path, font_name)
+            print(f"cProfile stats for the {len(prof_paths)} slowest files saved to '{Path(output_folder) / 'profiles'}'.")
+
 if __name__ == "__main__":
-    main()
+    main(ARGUMENTS)
@@ -0,0 +1,157 @@
+# usage  python -m pytest tests/test_filters.py
+# Table-driven checks of the .gitignore matcher and the discovery filters.
+
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import convert_to_pdf
+
+# (.gitignore lines, path, is_dir, expected GitIgnore.match result): True is ignored,
+# False is included again by a negated pattern, None is not matched by any pattern
+GITIGNORE_CASES = [
+    # Negation: the last matching pattern decides
+    (['*.log', '!keep.log'], 'debug.log', False, True),
+    (['*.log', '!keep.log'], 'keep.log', False, False),
+    (['*.log', '!keep.log'], 'logs/keep.log', False, False),
+    (['!keep.log', '*.log'], 'keep.log', False, True),
+    (['*', '!*/', '!*.py'], 'src', True, False),
+    (['*', '!*/', '!*.py'], 'src/notes.txt', False, True),
+    (['*.log'], 'README', False, None),
+    # A pattern without a slash matches at any depth; a leading or middle slash anchors it
+    (['build'], 'build', True, True),
+    (['build'], 'src/build', True, True),
+    (['build'], 'src/build', False, True),
+    (['/build'], 'build', True, True),
+    (['/build'], 'src/build', True, None),
+    (['doc/frotz'], 'doc/frotz', False, True),
+    (['doc/frotz'], 'src/doc/frotz', False, None),
+    (['src/*.py'], 'src/app.py', False, True),
+    (['src/*.py'], 'src/pkg/app.py', False, None),
+    # A trailing slash only matches folders
+    (['foo/'], 'foo', True, True),
+    (['foo/'], 'foo', False, None),
+    (['foo/'], 'src/foo', True, True),
+    (['/foo/'], 'src/foo', True, None),
+    # A leading '**/' matches in every folder, the root included
+    (['**/foo'], 'foo', False, True),
+    (['**/foo'], 'a/b/foo', True, True),
+    (['**/foo/bar'], 'foo/bar', False, True),
+    (['**/foo/bar'], 'x/y/foo/bar', False, True),
+    (['**/foo/bar'], 'foo/x/bar', False, None),
+    # A trailing '/**' matches everything below the folder but not the folder itself
+    (['a/**'], 'a', True, None),
+    (['a/**'], 'a/b', False, True),
+    (['a/**'], 'a/b/c', True, True),
+    (['a/**'], 'x/a/b', False, None),
+    (['a/**/b'], 'a/b', False, True),
+    (['a/**/b'], 'a/x/y/b', False, True),
+    # '*', '?' and character classes never match '/'
+    (['a?c'], 'abc', False, True),
+    (['a?c'], 'a/c', False, None),
+    (['[ab].txt'], 'b.txt', False, True),
+    (['[ab].txt'], 'c.txt', False, None),
+    (['[!a].txt'], 'c.txt', False, True),
+    (['[!a].txt'], 'a.txt', False, None),
+    # Comments, escapes and trailing spaces
+    (['#notes', '*.tmp'], '#notes', False, None),
+    (['\\#notes'], '#notes', False, True),
+    (['\\!important'], '!important', False, True),
+    (['*', '!important'], 'important', False, False),
+    (['trailing   '], 'trailing', False, True),
+    (['space\\ '], 'space ', False, True),
+    (['space\\ '], 'space', False, None),
+]
+
+@pytest.mark.parametrize('lines, path, is_dir, expected', GITIGNORE_CASES)
+def test_gitignore_match(lines, path, is_dir, expected):
+    assert convert_to_pdf.GitIgnore(lines).match(path, is_dir) is expected
+
+# (filter settings, [(file path, skip_file result)], [(folder path, skip_folder result)])
+PATH_FILTER_CASES = [
+    # No rules: nothing is skipped
+    ({}, [('a.py', False), ('.hidden/a.py', False)], [('build', False)]),
+    # Excluded folders are pruned; a folder-only glob does not skip files of that name
+    ({'exclude': {'globs': ['build/']}},
+     [('build', False), ('src/build.py', False)],
+     [('build', True), ('src/build', True)]),
+    # Exclude rules win over include rules
+    ({'exclude': {'globs': ['*.gen.py']}, 'include': {'extensions': ['.py']}},
+     [('app.py', False), ('app.gen.py', True), ('app.js', True), ('src/app.PY', False)],
+     [('src', False)]),
+    ({'exclude': {'globs': ['legacy/']}, 'include': {'globs': ['/src/']}},
+     [('src/app.py', False), ('lib/app.py', True)],
+     [('src', False), ('src/legacy', True), ('lib', True)]),
+    # An included folder includes every file below it; anchored include globs prune the
+    # folders outside their literal prefix
+    ({'include': {'globs': ['/src/']}},
+     [('src/a/b.js', False), ('lib/x.js', True), ('lib/src/x.js', True), ('x.js', True)],
+     [('src', False), ('src/a', False), ('lib', True)]),
+    ({'include': {'globs': ['src/']}},
+     [('src/a/b.js', False), ('lib/src/x.js', False), ('lib/x.js', True)],
+     [('lib', False)]),
+    ({'include': {'globs': ['src/*/main.py']}},
+     [('src/pkg/main.py', False), ('src/pkg/sub/main.py', True), ('src/main.py', True)],
+     [('src', False), ('src/pkg', False), ('lib', True)]),
+    # Unanchored include globs and regexes can match anywhere, so no folder is pruned
+    ({'include': {'globs': ['*.md']}},
+     [('docs/guide.md', False), ('guide.txt', True)],
+     [('docs', False)]),
+    ({'exclude': {'regexes': [r'(^|/)test_']}, 'include': {'regexes': [r'\.py$']}},
+     [('tests/test_app.py', True), ('app.py', False), ('app.pyc', True)],
+     [('tests', False)]),
+    # The default FILTERS
+    (convert_to_pdf.FILTERS,
+     [('README.md', True), ('docs/README.md', True), ('.env', True), ('src/app.py', False)],
+     [('.git', True), ('node_modules', True), ('pkg/__pycache__', True), ('src', False)]),
+]
+
+@pytest.mark.parametrize('config, files, folders', PATH_FILTER_CASES)
+def test_path_filter(config, files, folders):
+    path_filter = convert_to_pdf.PathFilter(config)
+    assert [(path, path_filter.skip_file(path)) for path, _ in files] == files
+    assert [(path, path_filter.skip_folder(path)) for path, _ in folders] == folders
+
+@pytest.mark.parametrize('config, size, mtime, expected', [
+    ({'min_size': 10, 'max_size': 100}, 9, 0, True),
+    ({'min_size': 10, 'max_size': 100}, 10, 0, False),
+    ({'min_size': 10, 'max_size': 100}, 101, 0, True),
+    ({'modified_after': '2024-01-01T00:00:00+00:00'}, 1, 1704067199, True),
+    ({'modified_after': '2024-01-01T00:00:00+00:00'}, 1, 1704067200, False),
+    ({'modified_before': '2024-01-01T00:00:00+00:00'}, 1, 1704067201, True),
+])
+def test_path_filter_stat(config, size, mtime, expected):
+    path_filter = convert_to_pdf.PathFilter(config)
+    assert path_filter.checks_stat
+    assert path_filter.skip_stat(SimpleNamespace(st_size=size, st_mtime=mtime)) is expected
+
+@pytest.mark.parametrize('config', [
+    {'exclude': {'paths': ['a']}},
+    {'include': {'regexes': ['(']}},
+    {'max_size': '1MB'},
+    {'modified_after': 20240101},
+    {'unknown': True},
+])
+def test_path_filter_rejects_invalid_settings(config):
+    with pytest.raises(ValueError):
+        convert_to_pdf.PathFilter(config)
+
+def test_load_extends_defaults(tmp_path):
+    path = tmp_path / 'filters.json'
+    path.write_text(json.dumps({'exclude': {'globs': ['*.lock']}, 'max_size': 1000}))
+    path_filter = convert_to_pdf.PathFilter.load(str(path))
+    assert path_filter.skip_file('poetry.lock')
+    assert path_filter.skip_file('README.md')
+    assert path_filter.skip_stat(SimpleNamespace(st_size=1001, st_mtime=0))
+
+def test_load_without_inherit(tmp_path):
+    path = tmp_path / 'filters.json'
+    path.write_text(json.dumps({'inherit': False, 'include': {'extensions': ['md']}}))
+    path_filter = convert_to_pdf.PathFilter.load(str(path))
+    assert not path_filter.skip_file('README.md')
+    assert path_filter.skip_file('app.py')
+    assert not path_filter.skip_folder('.github')
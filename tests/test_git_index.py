@@ -0,0 +1,127 @@
+# usage  python -m pytest tests/test_git_index.py
+# Builds small repositories with git and checks the files --discovery git finds in their index.
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import convert_to_pdf
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason="git is not installed")
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'DejaVu Sans Mono for Powerline.ttf')
+
+# Tracked files of the test repository besides .gitignore; the ones FILTERS skips are listed in SKIPPED
+TRACKED = {
+    'main.py': 'print("main")\n',
+    'src/app.py': 'x = 1\n',
+    'src/deep/util.js': 'export const y = 2;\n',
+    'docs/guide.txt': 'Guide\n',
+    'docs/README.md': '# skipped by FILTERS\n',
+    '.config/settings.py': '# hidden folder, skipped by FILTERS\n',
+}
+SKIPPED = {'docs/README.md', '.config/settings.py'}
+EXPECTED = sorted(set(TRACKED) - SKIPPED)
+
+def git(repo, *args):
+    """
+    Runs git in repo and returns its stdout.
+    """
+    return subprocess.run(['git', '-C', str(repo), *args], check=True, capture_output=True, text=True).stdout
+
+def make_repo(path, object_format=None):
+    """
+    Creates a repository at path with TRACKED added to its index, an untracked file
+    and an ignored one.
+    """
+    init = ['init', '-q'] + ([f'--object-format={object_format}'] if object_format else [])
+    subprocess.run(['git', *init, str(path)], check=True, capture_output=True)
+    for relative_path, content in TRACKED.items():
+        (path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (path / relative_path).write_text(content)
+    (path / '.gitignore').write_text('build/\n')
+    git(path, 'add', '.')
+    (path / 'untracked.py').write_text('pass\n')
+    (path / 'build').mkdir()
+    (path / 'build' / 'ignored.py').write_text('pass\n')
+    return path
+
+def found_files(input_folder, tree):
+    """
+    Returns the sorted '/'-separated paths of the files in tree, relative to input_folder.
+    """
+    return sorted(os.path.relpath(file_path, input_folder).replace(os.sep, '/')
+                  for file_path, _ in convert_to_pdf.tree_files(tree))
+
+def index_version(repo):
+    """
+    Returns the format version in the header of repo's index.
+    """
+    with open(repo / '.git' / 'index', 'rb') as f:
+        return int.from_bytes(f.read(8)[4:], 'big')
+
+@pytest.mark.parametrize('version', [2, 3, 4])
+def test_index_versions(tmp_path, version):
+    repo = make_repo(tmp_path / 'repo')
+    expected = EXPECTED
+    if version == 3:
+        # git only writes version 3 when an entry has extended flags, as intent-to-add entries do
+        (repo / 'planned.py').write_text('pass\n')
+        git(repo, 'add', '--intent-to-add', 'planned.py')
+        expected = sorted(EXPECTED + ['planned.py'])
+    git(repo, 'update-index', '--index-version', str(version))
+    assert index_version(repo) == version
+    assert found_files(repo, convert_to_pdf.scan_git_index(str(repo))) == expected
+
+@pytest.mark.parametrize('version', [3, 4])
+def test_skip_worktree_entries_are_left_out(tmp_path, version):
+    repo = make_repo(tmp_path / 'repo')
+    git(repo, 'update-index', '--index-version', str(version))
+    git(repo, 'update-index', '--skip-worktree', 'src/app.py')
+    assert index_version(repo) == version
+    assert found_files(repo, convert_to_pdf.scan_git_index(str(repo))) == [p for p in EXPECTED if p != 'src/app.py']
+
+def test_sha256_repository(tmp_path):
+    try:
+        repo = make_repo(tmp_path / 'repo', object_format='sha256')
+    except subprocess.CalledProcessError:
+        pytest.skip("git cannot create SHA-256 repositories")
+    assert git(repo, 'rev-parse', '--show-object-format').strip() == 'sha256'
+    for version in (2, 4):
+        git(repo, 'update-index', '--index-version', str(version))
+        assert found_files(repo, convert_to_pdf.scan_git_index(str(repo))) == EXPECTED
+
+def test_subfolder_of_repository(tmp_path):
+    repo = make_repo(tmp_path / 'repo')
+    src = repo / 'src'
+    assert found_files(src, convert_to_pdf.scan_git_index(str(src))) == ['app.py', 'deep/util.js']
+
+def test_outside_repository(tmp_path):
+    (tmp_path / 'a.py').write_text('pass\n')
+    assert convert_to_pdf.scan_git_index(str(tmp_path)) is None
+
+@pytest.mark.parametrize('damage', ['corrupt', 'truncated'])
+def test_unreadable_index_falls_back_to_walk(tmp_path, damage):
+    repo = make_repo(tmp_path / 'repo')
+    index_path = repo / '.git' / 'index'
+    data = index_path.read_bytes()
+    index_path.write_bytes(b'JUNK' * 16 if damage == 'corrupt' else data[:len(data) // 2])
+    assert convert_to_pdf.scan_git_index(str(repo)) is None
+
+    # main() then scans the folder honouring .gitignore: the untracked file is found, the ignored one is not
+    output = tmp_path / 'output'
+    args = convert_to_pdf.parse_arguments([str(repo), str(output), '--font', FONT_PATH, '--discovery', 'git',
+                                           '--log-file', str(tmp_path / 'conversion.log')])
+    try:
+        convert_to_pdf.main(args)
+    finally:
+        convert_to_pdf.stop_logging()
+    pdfs = output / 'individual_pdfs'
+    assert (pdfs / 'untracked.pdf').exists()
+    assert (pdfs / 'src' / 'app.pdf').exists()
+    assert not (pdfs / 'build').exists()
+    assert "No readable git index" in (tmp_path / 'conversion.log').read_text()
@@ -0,0 +1,111 @@
+# usage  python -m pytest tests/test_optimize.py
+# Writes small PDFs with --optimize and reads them back with PyPDF2 and a cross-reference stream parser.
+
+import os
+import re
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import convert_to_pdf
+
+PdfReader = pytest.importorskip('PyPDF2').PdfReader
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'DejaVu Sans Mono for Powerline.ttf')
+LEVELS = [0, 9]
+
+# Long enough for several pages, with characters outside ASCII
+SOURCE = "def hello():\n    return 'héllo wörld'\n" + ''.join(f"line_{i} = {i}\n" for i in range(150))
+
+def xref_stream_entries(data):
+    """
+    Parses the cross-reference stream startxref points at, checks that every object it
+    lists resolves, and returns {object number: (type, field 2, field 3)}.
+    """
+    offset = int(re.search(rb'startxref\s+(\d+)\s+%%EOF\s*$', data).group(1))
+    header = re.match(rb'(\d+) 0 obj\s*<<', data[offset:])
+    assert header, "startxref does not point at an object"
+    stream_start = data.index(b'stream', offset)
+    dictionary = data[offset:stream_start]
+    assert re.search(rb'/Type\s*/XRef\b', dictionary)
+    widths = [int(width) for width in re.search(rb'/W\s*\[([\d\s]+)\]', dictionary).group(1).split()]
+    index = [int(number) for number in re.search(rb'/Index\s*\[([\d\s]+)\]', dictionary).group(1).split()]
+    size = int(re.search(rb'/Size\s+(\d+)', dictionary).group(1))
+    length = int(re.search(rb'/Length\s+(\d+)', dictionary).group(1))
+    body_start = stream_start + len(re.match(rb'stream\r?\n', data[stream_start:]).group(0))
+    rows = zlib.decompress(data[body_start:body_start + length])
+
+    ids = [idnum for first, count in zip(index[::2], index[1::2]) for idnum in range(first, first + count)]
+    row_size = sum(widths)
+    assert len(rows) == len(ids) * row_size
+    assert max(ids) < size
+    entries = {}
+    for position, idnum in enumerate(ids):
+        row = rows[position * row_size:(position + 1) * row_size]
+        fields = []
+        for width in widths:
+            fields.append(int.from_bytes(row[:width], 'big'))
+            row = row[width:]
+        entries[idnum] = tuple(fields)
+
+    assert entries[int(header.group(1))] == (1, offset, 0)
+    for idnum, (kind, field, _) in entries.items():
+        if kind == 1:
+            assert re.match(rb'%d 0 obj\b' % idnum, data[field:]), f"object {idnum} is not at offset {field}"
+        elif kind == 2:
+            # Compressed objects must point at an object stream written in the file
+            assert entries.get(field, (None,))[0] == 1, f"object {idnum} is in missing object stream {field}"
+            assert re.search(rb'/Type\s*/ObjStm\b', data[entries[field][1]:data.index(b'stream', entries[field][1])])
+    return entries
+
+def check_pdf(path, pages):
+    """
+    Checks that the optimized PDF at path has pages pages and the text of SOURCE.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    entries = xref_stream_entries(data)
+    assert any(kind == 2 for kind, _, _ in entries.values()), "no objects were packed into object streams"
+    reader = PdfReader(path, strict=True)
+    assert len(reader.pages) == pages
+    text = '\n'.join(page.extract_text() for page in reader.pages)
+    assert "return 'héllo wörld'" in text
+    assert 'line_0 = 0' in text and 'line_149 = 149' in text
+    return reader
+
+@pytest.fixture
+def source_folder(tmp_path):
+    folder = tmp_path / 'src'
+    folder.mkdir()
+    (folder / 'app.py').write_text(SOURCE, encoding='utf-8')
+    return folder
+
+@pytest.mark.parametrize('level', LEVELS)
+def test_optimized_individual_pdf(tmp_path, source_folder, level):
+    output = tmp_path / 'out'
+    pages = convert_to_pdf.process_file(str(source_folder / 'app.py'), str(source_folder), str(output), FONT_PATH,
+                                        optimize=level)
+    assert pages > 1
+    check_pdf(output / 'app.pdf', pages)
+
+@pytest.mark.parametrize('level', LEVELS)
+def test_optimized_streamed_pdf(tmp_path, source_folder, level, monkeypatch):
+    monkeypatch.setattr(convert_to_pdf, 'MAX_FILE_SIZE', 100)
+    output = tmp_path / 'out'
+    pages = convert_to_pdf.process_file(str(source_folder / 'app.py'), str(source_folder), str(output), FONT_PATH,
+                                        optimize=level)
+    assert pages > 1
+    check_pdf(output / 'app.pdf', pages)
+
+@pytest.mark.parametrize('level', LEVELS)
+def test_optimized_merged_pdf(tmp_path, source_folder, level):
+    (source_folder / 'lib.py').write_text(SOURCE, encoding='utf-8')
+    output = tmp_path / 'out'
+    pages = sum(convert_to_pdf.process_file(str(source_folder / name), str(source_folder), str(output), FONT_PATH,
+                                            optimize=level)
+                for name in ('app.py', 'lib.py'))
+    convert_to_pdf.merge_pdfs(str(output), 'app_source.pdf', FONT_PATH, optimize=level)
+    reader = check_pdf(output / 'app_source.pdf', pages)
+    assert reader.pages[0].extract_text().startswith('File Location: ')